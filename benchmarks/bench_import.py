@@ -0,0 +1,353 @@
+#! /usr/bin/env python3
+"""
+Times each stage of an import against a synthetic tree (see synthtree.py) and writes the results as JSON.
+
+The stages are the same ones importPhotos runs: scan_import_files, build_image_objects, build_destination_map and the
+copy loop. For each stage the wall time, files/s, read/write syscalls (Linux only) and the peak RSS are recorded, plus
+MB/s for the stages that read file data: the copy, and build_destination_map (from the bytes it actually reads to
+compare colliding files). Scanning only lists directories and reading EXIF data only reads the file headers, so MB/s
+would say nothing about them.
+Results from different runs (or versions) can be compared with --baseline.
+
+Example:
+
+    benchmarks/bench_import.py --files 2000 --size-kb 4096 --output results.json
+    benchmarks/bench_import.py --files 2000 --size-kb 4096 --baseline results.json
+"""
+
+import contextlib
+import importlib.machinery
+import importlib.util
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+REPO_DIR = os.path.split(os.path.split(os.path.abspath(__file__))[0])[0]
+sys.path.insert(0, REPO_DIR)
+
+import synthtree  # noqa: E402
+from latencyfs import LatencyFS  # noqa: E402
+from src import verifiedcopy  # noqa: E402
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def load_import_photos():
+    """
+    Loads the importPhotos script as a module (it has no .py extension, so it cannot simply be imported).
+
+    :return: The module.
+    """
+
+    loader = importlib.machinery.SourceFileLoader("importPhotos", os.path.join(REPO_DIR, "importPhotos"))
+    spec = importlib.util.spec_from_loader("importPhotos", loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+
+    return module
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def read_io_counters():
+    """
+    Reads this process's I/O counters from /proc/self/io.
+
+    :return: A dictionary with the syscr, syscw, rchar and wchar counters, or an empty dictionary if they are not
+             available on this platform.
+    """
+
+    counters = dict()
+    try:
+        with open("/proc/self/io", "r") as f:
+            for line in f:
+                key, value = line.split(":")
+                counters[key.strip()] = int(value)
+    except (OSError, ValueError):
+        return dict()
+
+    return counters
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def peak_rss_kb():
+    """
+    Returns the peak resident set size of this process so far.
+
+    :return: The peak RSS in KB.
+    """
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # macOS reports bytes, Linux reports KB.
+        peak //= 1024
+
+    return peak
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class StageTimer(object):
+    """
+    A context manager that measures a single stage.
+    """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self,
+                 results,
+                 name,
+                 run_report=None):
+        """
+        :param results: The dictionary to add the stage's results to.
+        :param name: The name of the stage.
+        :param run_report: An optional run report whose "bytes_read" counter (the file data read and hashed) is
+               recorded for the stage. Defaults to None.
+        """
+
+        self.results = results
+        self.name = name
+        self.run_report = run_report
+        self.files = 0
+        self.bytes = 0
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __enter__(self):
+        self.start_io = read_io_counters()
+        if self.run_report is not None:
+            self.start_bytes_read = self.run_report.totals.get("bytes_read", 0)
+        self.start_time = time.perf_counter()
+        return self
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.perf_counter() - self.start_time
+        end_io = read_io_counters()
+
+        stage = {"wall_s": round(wall, 6),
+                 "files": self.files,
+                 "bytes": self.bytes,
+                 "files_per_s": round(self.files / wall, 3) if wall else None,
+                 "mb_per_s": round(self.bytes / 2**20 / wall, 3) if wall else None,
+                 "peak_rss_kb": peak_rss_kb()}
+        for key in ("syscr", "syscw", "rchar", "wchar"):
+            if key in end_io and key in self.start_io:
+                stage[key] = end_io[key] - self.start_io[key]
+        if self.run_report is not None:
+            stage["bytes_read"] = self.run_report.totals.get("bytes_read", 0) - self.start_bytes_read
+
+        self.results[self.name] = stage
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def run_benchmark(root,
+                  args):
+    """
+    Generates the synthetic tree under root and runs each import stage against it.
+
+    :param root: The directory to generate the tree in.
+    :param args: The parsed command line arguments.
+
+    :return: A dictionary of results.
+    """
+
+    import_photos = load_import_photos()
+
+    summary = synthtree.generate_tree(root,
+                                      num_files=args.files,
+                                      size_kb=args.size_kb,
+                                      cr2_ratio=args.cr2_ratio,
+                                      sidecar_ratio=args.sidecar_ratio,
+                                      duplicate_ratio=args.duplicate_ratio,
+                                      catalog_overlap_ratio=args.catalog_overlap_ratio,
+                                      catalog_files=args.catalog_files,
+                                      seed=args.seed)
+
+    catalog_d = summary["catalog_dir"]
+    notify_obj = import_photos.Notify("stdout", False)
+    stages = dict()
+
+    # With --latency-ms, the catalog behaves as if it were on a network filesystem: every filesystem call the async
+    # engine makes, and every open and read of a catalog file, is delayed. Compare --async-io 1 (one call at a time)
+    # against higher values.
+    latency_fs = None
+    catalog_reads = contextlib.nullcontext()
+    if args.latency_ms > 0:
+        latency_fs = LatencyFS(args.latency_ms / 1000.0)
+        catalog_reads = latency_fs.patch_catalog_reads(catalog_d)
+
+    async_fs = None
+    if args.async_io > 0:
+        async_fs = import_photos.AsyncFS(args.async_io, fs=latency_fs if latency_fs is not None else os)
+
+    # Only used to count the file data each stage actually reads.
+    run_report = import_photos.RunReport()
+
+    checksum_index = import_photos.ChecksumIndex(catalog_d, hash_algorithm=args.hash)
+    try:
+        with catalog_reads:
+            with StageTimer(stages, "scan_import_files") as stage:
+                image_paths = sorted(import_photos.scan_import_files([summary["import_dir"]]))
+                stage.files = len(image_paths)
+
+            with StageTimer(stages, "scan_catalog_files") as stage:
+                catalogfiles_obj = import_photos.scan_catalog_files(catalog_d, checksum_index)
+                digest_cache = import_photos.DigestCache(checksum_index, async_fs=async_fs)
+                catalog_size_map = import_photos.build_catalog_size_map(catalogfiles_obj.files, digest_cache, async_fs)
+                stage.files = len(catalogfiles_obj.files)
+
+            with StageTimer(stages, "build_image_objects") as stage:
+                image_objects = import_photos.build_image_objects(image_paths,
+                                                                  catalog_d,
+                                                                  True,
+                                                                  notify_obj,
+                                                                  True,
+                                                                  ["xmp"],
+                                                                  args.jobs)
+                stage.files = len(image_objects)
+
+            with StageTimer(stages, "build_destination_map", run_report) as stage:
+                dest_dict, collisions_obj = import_photos.build_destination_map(image_objects,
+                                                                                notify_obj,
+                                                                                checksum_index,
+                                                                                digest_cache,
+                                                                                catalog_size_map,
+                                                                                async_fs)
+                stage.files = len(image_objects)
+
+            with StageTimer(stages, "copy") as stage:
+                copy_list = list(dest_dict.values())
+                copyscheduler_obj = import_photos.CopyScheduler(notify_obj,
+                                                                jobs=args.copy_jobs,
+                                                                checksum_index=checksum_index,
+                                                                copy_mode=args.copy_mode,
+                                                                async_fs=async_fs)
+                errors = copyscheduler_obj.run(copy_list)
+                stage.files = len(copy_list)
+                stage.bytes = sum(copyscheduler_obj.unit_size(image_obj) for image_obj in copy_list)
+    finally:
+        if async_fs is not None:
+            async_fs.close()
+        checksum_index.close()
+        run_report.finish()
+
+    # Only comparing files reads their data, and only the files that collide (or share a size with a catalog file) are
+    # read. Its MB/s is worked out from the bytes it actually read. The other stages before the copy are measured in
+    # files/s only.
+    for name in ("scan_import_files", "build_image_objects"):
+        stages[name]["mb_per_s"] = None
+    stage = stages["build_destination_map"]
+    stage["bytes"] = stage["bytes_read"]
+    stage["mb_per_s"] = round(stage["bytes"] / 2**20 / stage["wall_s"], 3) if stage["wall_s"] else None
+
+    return {"version": 1,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "parameters": {"files": args.files,
+                           "size_kb": args.size_kb,
+                           "cr2_ratio": args.cr2_ratio,
+                           "sidecar_ratio": args.sidecar_ratio,
+                           "duplicate_ratio": args.duplicate_ratio,
+                           "catalog_overlap_ratio": args.catalog_overlap_ratio,
+                           "catalog_files": args.catalog_files,
+                           "seed": args.seed,
+                           "jobs": args.jobs,
+                           "copy_jobs": args.copy_jobs,
+                           "copy_mode": args.copy_mode,
+                           "hash": args.hash,
+                           "async_io": args.async_io,
+                           "latency_ms": args.latency_ms},
+            "tree": summary,
+            "collisions": {key: len(value) for key, value in vars(collisions_obj).items()},
+            "copy_errors": len(errors),
+            "stages": stages}
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def compare(results,
+            baseline,
+            threshold):
+    """
+    Compares the wall time of each stage against a baseline run and prints the change.
+
+    :param results: The results of this run.
+    :param baseline: The results of the baseline run.
+    :param threshold: The fractional slowdown above which a stage counts as a regression.
+
+    :return: True if no stage regressed, False otherwise.
+    """
+
+    ok = True
+    for name, stage in results["stages"].items():
+        if name not in baseline["stages"] or not baseline["stages"][name]["wall_s"]:
+            continue
+        change = stage["wall_s"] / baseline["stages"][name]["wall_s"] - 1
+        status = "ok"
+        if change > threshold:
+            status = "REGRESSION"
+            ok = False
+        print("%-24s %10.3fs -> %10.3fs  %+7.1f%%  %s" % (name, baseline["stages"][name]["wall_s"], stage["wall_s"],
+                                                          change * 100, status), file=sys.stderr)
+
+    return ok
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def main():
+
+    parser = ArgumentParser(description="Benchmarks each stage of importPhotos against a synthetic tree.")
+    parser.add_argument("--files", type=int, default=1000, help="The number of images to import.")
+    parser.add_argument("--size-kb", type=int, default=1024, help="The average image size in KB.")
+    parser.add_argument("--cr2-ratio", type=float, default=0.5, help="The fraction of CR2-like raw files.")
+    parser.add_argument("--sidecar-ratio", type=float, default=0.2, help="The fraction of images with a sidecar.")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0, help="The fraction of duplicate images.")
+    parser.add_argument("--catalog-overlap-ratio", type=float, default=0.0,
+                        help="The fraction of images that are already in the catalog.")
+    parser.add_argument("--catalog-files", type=int, default=0, help="The number of unrelated catalog images.")
+    parser.add_argument("--seed", type=int, default=0, help="The random seed.")
+    parser.add_argument("--jobs", type=int, default=1, help="The --jobs value to use when reading EXIF data.")
+    parser.add_argument("--copy-jobs", type=int, default=1, help="The --copy-jobs value to use when copying.")
+    parser.add_argument("--copy-mode", choices=verifiedcopy.COPY_MODES, default="python",
+                        help="The --copy-mode value to use when copying.")
+    parser.add_argument("--hash", choices=verifiedcopy.HASH_ALGORITHMS, default=verifiedcopy.DEFAULT_HASH_ALGORITHM,
+                        help="The --hash value to use when comparing and verifying files.")
+    parser.add_argument("--async-io", type=int, default=0,
+                        help="The --async-io value to use when checking the catalog.")
+    parser.add_argument("--latency-ms", type=float, default=0.0,
+                        help="The latency to add to every filesystem call made with --async-io, and to every open and "
+                             "read of a catalog file, in milliseconds.")
+    parser.add_argument("--work-dir", help="Where to generate the tree. Defaults to a temporary directory.")
+    parser.add_argument("--keep", action="store_true", help="Do not delete the generated tree afterwards.")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout.")
+    parser.add_argument("--baseline", help="A previous JSON results file to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="The slowdown (as a fraction) that counts as a regression. Defaults to 0.1.")
+    args = parser.parse_args(sys.argv[1:])
+
+    root = tempfile.mkdtemp(prefix="importPhotos_bench_", dir=args.work_dir)
+    try:
+        results = run_benchmark(root, args)
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+
+    main()
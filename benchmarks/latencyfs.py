@@ -0,0 +1,139 @@
+"""
+A stand-in for a network filesystem: every filesystem call made through it is delayed by a fixed latency before it is
+passed on to the local disk. Used with src/asyncfs.py to see how an import behaves against a catalog on SMB/NFS
+without needing one.
+
+The stat and makedirs calls are made through the async engine. Catalog files are read (to compare them with the files
+being imported) by src/verifiedcopy.py, which opens them itself, so patch_catalog_reads delays the opens and reads of
+files under the catalog made by that module as well.
+
+Example:
+
+    from src.asyncfs import AsyncFS
+    latency_fs = LatencyFS(0.005)
+    async_fs = AsyncFS(32, fs=latency_fs)
+    with latency_fs.patch_catalog_reads("/path/to/catalog"):
+        ...
+"""
+
+import builtins
+import os
+import time
+from contextlib import contextmanager
+
+from src import verifiedcopy
+
+
+class LatencyFile(object):
+    """
+    Wraps an open file and delays each read by latency_s seconds, as every read of a file on a network filesystem is a
+    round trip to the server. Everything else is passed on to the file.
+    """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self,
+                 latency_fs,
+                 file_obj):
+        """
+        :param latency_fs: The LatencyFS object that opened the file.
+        :param file_obj: The open file.
+        """
+
+        self.latency_fs = latency_fs
+        self.file_obj = file_obj
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def read(self,
+             *args):
+        self.latency_fs.delay()
+        return self.file_obj.read(*args)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def readinto(self,
+                 buffer):
+        self.latency_fs.delay()
+        return self.file_obj.readinto(buffer)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __getattr__(self,
+                    name):
+        return getattr(self.file_obj, name)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __enter__(self):
+        return self
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.file_obj.close()
+
+
+class LatencyFS(object):
+    """
+    Delays each call by latency_s seconds, then does the same thing as the os module.
+    """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self,
+                 latency_s):
+        """
+        :param latency_s: The delay added to every call, in seconds.
+        """
+
+        self.latency_s = latency_s
+        self.num_calls = 0
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def delay(self):
+        self.num_calls += 1
+        time.sleep(self.latency_s)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def stat(self,
+             path):
+        self.delay()
+        return os.stat(path)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def makedirs(self,
+                 path,
+                 exist_ok=False):
+        self.delay()
+        os.makedirs(path, exist_ok=exist_ok)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def open(self,
+             path,
+             *args,
+             **kwargs):
+        self.delay()
+        return LatencyFile(self, builtins.open(path, *args, **kwargs))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @contextmanager
+    def patch_catalog_reads(self,
+                            catalog_path):
+        """
+        A context manager that makes src/verifiedcopy.py open the files under the catalog through this object, so that
+        opening them and every read from them is delayed. Files elsewhere (the files being imported) are opened as
+        usual.
+
+        :param catalog_path: The path to the root of the catalog.
+
+        :return: A generator (for use with the "with" statement).
+        """
+
+        catalog_path = os.path.abspath(catalog_path)
+
+        def latency_open(path, *args, **kwargs):
+            if isinstance(path, (str, bytes, os.PathLike)):
+                abs_path = os.path.abspath(os.fsdecode(path))
+                if os.path.commonpath([catalog_path, abs_path]) == catalog_path:
+                    return self.open(path, *args, **kwargs)
+            return builtins.open(path, *args, **kwargs)
+
+        verifiedcopy.open = latency_open
+        try:
+            yield
+        finally:
+            del verifiedcopy.open
@@ -0,0 +1,243 @@
+#! /usr/bin/env python3
+"""
+Generates synthetic import trees (and matching catalogs) for benchmarking importPhotos.
+
+The images are JPEG files and CR2-like TIFF files that carry a real EXIF DateTimeOriginal tag, padded out with random
+data to the requested size. Everything is driven by a seeded random number generator, so the same arguments always
+produce the same tree.
+
+Example:
+
+    benchmarks/synthtree.py /tmp/bench --files 5000 --size-kb 2048 --sidecar-ratio 0.3 --duplicate-ratio 0.05
+"""
+
+import os
+import random
+import struct
+import sys
+from argparse import ArgumentParser
+
+EXIF_IFD_POINTER_TAG = 0x8769
+DATE_TIME_ORIGINAL_TAG = 0x9003
+
+FILES_PER_DIR = 200
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def build_tiff_exif(date_str,
+                    cr2=False):
+    """
+    Builds a little endian TIFF structure whose IFD0 points to an Exif IFD holding DateTimeOriginal.
+
+    :param date_str: The date, in EXIF format (e.g. "2020:01:31 12:00:00").
+    :param cr2: If True, the CR2 signature is written after the TIFF header, like a Canon raw file.
+
+    :return: The TIFF bytes.
+    """
+
+    date_bytes = date_str.encode("ascii") + b"\x00"
+
+    header_size = 16 if cr2 else 8
+    ifd0_offset = header_size
+    exif_ifd_offset = ifd0_offset + 2 + 12 + 4
+    date_offset = exif_ifd_offset + 2 + 12 + 4
+
+    data = b"II*\x00" + struct.pack("<I", ifd0_offset)
+    if cr2:
+        data += b"CR\x02\x00" + struct.pack("<I", 0)
+    data += struct.pack("<H", 1) + struct.pack("<HHII", EXIF_IFD_POINTER_TAG, 4, 1, exif_ifd_offset)
+    data += struct.pack("<I", 0)
+    data += struct.pack("<H", 1) + struct.pack("<HHII", DATE_TIME_ORIGINAL_TAG, 2, len(date_bytes), date_offset)
+    data += struct.pack("<I", 0)
+    data += date_bytes
+
+    return data
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def build_jpeg(date_str,
+               payload):
+    """
+    Builds a JPEG file with an APP1 Exif segment followed by the payload as scan data.
+
+    :param date_str: The date, in EXIF format.
+    :param payload: The random bytes that make up the rest of the file.
+
+    :return: The file contents.
+    """
+
+    app1 = b"Exif\x00\x00" + build_tiff_exif(date_str)
+    return (b"\xff\xd8" + b"\xff\xe1" + struct.pack(">H", len(app1) + 2) + app1 + b"\xff\xda\x00\x02" + payload +
+            b"\xff\xd9")
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def build_cr2(date_str,
+              payload):
+    """
+    Builds a CR2-like TIFF file followed by the payload.
+
+    :param date_str: The date, in EXIF format.
+    :param payload: The random bytes that make up the rest of the file.
+
+    :return: The file contents.
+    """
+
+    return build_tiff_exif(date_str, cr2=True) + payload
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def build_sidecar(file_name,
+                  rng):
+    """
+    Builds the contents of a small xmp sidecar file.
+
+    :param file_name: The name of the image the sidecar belongs to.
+    :param rng: The random number generator.
+
+    :return: The file contents.
+    """
+
+    return ("<x:xmpmeta xmlns:x=\"adobe:ns:meta/\"><rdf:RDF><rdf:Description rdf:about=\"" + file_name + "\" "
+            "xmp:Rating=\"" + str(rng.randint(0, 5)) + "\"/></rdf:RDF></x:xmpmeta>\n").encode("utf-8")
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def generate_tree(root,
+                  num_files=1000,
+                  size_kb=1024,
+                  size_jitter=0.5,
+                  cr2_ratio=0.5,
+                  sidecar_ratio=0.2,
+                  duplicate_ratio=0.0,
+                  catalog_overlap_ratio=0.0,
+                  catalog_files=0,
+                  seed=0):
+    """
+    Generates an import tree at root/import and a catalog at root/catalog.
+
+    :param root: The directory in which to generate the trees.
+    :param num_files: The number of images in the import tree. Defaults to 1000.
+    :param size_kb: The average size of an image in KB. Defaults to 1024.
+    :param size_jitter: How far (as a fraction of size_kb) the size of an image may vary either way. Defaults to 0.5.
+    :param cr2_ratio: The fraction of images that are CR2-like raw files rather than JPEGs. Defaults to 0.5.
+    :param sidecar_ratio: The fraction of images that have an xmp sidecar. Defaults to 0.2.
+    :param duplicate_ratio: The fraction of images that are byte for byte copies of an earlier image in the import tree
+           (with a different name). Defaults to 0.
+    :param catalog_overlap_ratio: The fraction of images that already exist in the catalog at their destination path.
+           Defaults to 0.
+    :param catalog_files: The number of unrelated images to put in the catalog. Defaults to 0.
+    :param seed: The seed for the random number generator. Defaults to 0.
+
+    :return: A dictionary describing what was generated.
+    """
+
+    rng = random.Random(seed)
+
+    import_d = os.path.join(root, "import")
+    catalog_d = os.path.join(root, "catalog")
+    os.makedirs(import_d, exist_ok=True)
+    os.makedirs(catalog_d, exist_ok=True)
+
+    def random_date():
+        return "%04d:%02d:%02d %02d:%02d:%02d" % (rng.randint(2015, 2024), rng.randint(1, 12), rng.randint(1, 28),
+                                                  rng.randint(0, 23), rng.randint(0, 59), rng.randint(0, 59))
+
+    def random_image(file_num, prefix):
+        size = int(size_kb * 1024 * (1 + rng.uniform(-size_jitter, size_jitter)))
+        date_str = random_date()
+        payload = rng.randbytes(max(size - 256, 0))
+        if rng.random() < cr2_ratio:
+            return prefix + "%05d.CR2" % file_num, date_str, build_cr2(date_str, payload)
+        return prefix + "%05d.JPG" % file_num, date_str, build_jpeg(date_str, payload)
+
+    def write_file(file_path, data):
+        os.makedirs(os.path.split(file_path)[0], exist_ok=True)
+        with open(file_path, "wb") as f:
+            f.write(data)
+
+    summary = {"import_dir": import_d,
+               "catalog_dir": catalog_d,
+               "images": 0,
+               "sidecars": 0,
+               "duplicates": 0,
+               "catalog_overlaps": 0,
+               "catalog_files": 0,
+               "bytes": 0}
+
+    previous = list()
+    for file_num in range(num_files):
+
+        dir_path = os.path.join(import_d, "DCIM", "%03dCANON" % (100 + file_num // FILES_PER_DIR))
+
+        if previous and rng.random() < duplicate_ratio:
+            _, date_str, data = rng.choice(previous)
+            file_name = "DUP_%05d" % file_num + (".CR2" if data[:2] == b"II" else ".JPG")
+            summary["duplicates"] += 1
+        else:
+            file_name, date_str, data = random_image(file_num, "IMG_")
+            # Only keep a small pool of candidates to duplicate, so memory use stays bounded.
+            if len(previous) < 64:
+                previous.append((file_name, date_str, data))
+            else:
+                previous[rng.randrange(64)] = (file_name, date_str, data)
+
+        write_file(os.path.join(dir_path, file_name), data)
+        summary["images"] += 1
+        summary["bytes"] += len(data)
+
+        if rng.random() < sidecar_ratio:
+            sidecar = build_sidecar(file_name, rng)
+            write_file(os.path.join(dir_path, os.path.splitext(file_name)[0] + ".xmp"), sidecar)
+            summary["sidecars"] += 1
+            summary["bytes"] += len(sidecar)
+
+        if rng.random() < catalog_overlap_ratio:
+            date = date_str.split(" ")[0].replace(":", "-")
+            write_file(os.path.join(catalog_d, date[:4], date, date + "-" + file_name), data)
+            summary["catalog_overlaps"] += 1
+
+    for file_num in range(catalog_files):
+        file_name, date_str, data = random_image(file_num, "CAT_")
+        date = date_str.split(" ")[0].replace(":", "-")
+        write_file(os.path.join(catalog_d, date[:4], date, date + "-" + file_name), data)
+        summary["catalog_files"] += 1
+
+    return summary
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def main():
+
+    parser = ArgumentParser(description="Generates a synthetic import tree and catalog for benchmarking.")
+    parser.add_argument("root", help="The directory in which to generate the import and catalog trees.")
+    parser.add_argument("--files", type=int, default=1000, help="The number of images to import.")
+    parser.add_argument("--size-kb", type=int, default=1024, help="The average image size in KB.")
+    parser.add_argument("--size-jitter", type=float, default=0.5, help="How much image sizes vary (0 - 1).")
+    parser.add_argument("--cr2-ratio", type=float, default=0.5, help="The fraction of CR2-like raw files.")
+    parser.add_argument("--sidecar-ratio", type=float, default=0.2, help="The fraction of images with a sidecar.")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0, help="The fraction of duplicate images.")
+    parser.add_argument("--catalog-overlap-ratio", type=float, default=0.0,
+                        help="The fraction of images that are already in the catalog.")
+    parser.add_argument("--catalog-files", type=int, default=0, help="The number of unrelated catalog images.")
+    parser.add_argument("--seed", type=int, default=0, help="The random seed.")
+    args = parser.parse_args(sys.argv[1:])
+
+    summary = generate_tree(args.root,
+                            num_files=args.files,
+                            size_kb=args.size_kb,
+                            size_jitter=args.size_jitter,
+                            cr2_ratio=args.cr2_ratio,
+                            sidecar_ratio=args.sidecar_ratio,
+                            duplicate_ratio=args.duplicate_ratio,
+                            catalog_overlap_ratio=args.catalog_overlap_ratio,
+                            catalog_files=args.catalog_files,
+                            seed=args.seed)
+
+    for key, value in summary.items():
+        print(key + ":", value)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,246 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.lrucache import LRUCache
+
+
+class AsyncFS(object):
+    """
+    A class to issue many filesystem operations at once, for catalogs that live on a network filesystem (SMB, NFS)
+    where every stat, mkdir or read costs a full round trip to the server. Latency rather than bandwidth then limits
+    the import, and doing the operations one after the other wastes almost all of the time waiting.
+
+    Batches of operations are run on an asyncio event loop that keeps up to a fixed number of them in flight at a time.
+    The filesystem calls themselves block, so each one is handed to a worker thread. Every stat result (including
+    "does not exist") is cached for the rest of the run, so the code that later checks the same paths one at a time
+    gets its answers without going back to the server. The cache may be given a maximum size, so that a streaming import
+    does not keep a stat result for every file it has seen.
+
+    The filesystem operations are taken from an fs object with stat and makedirs functions (the os module by default),
+    so a stand-in that adds latency can be used to test the engine against a local disk.
+    """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self,
+                 concurrency=16,
+                 fs=os,
+                 max_cached_stats=None):
+        """
+        Sets up the engine.
+
+        :param concurrency: The maximum number of operations in flight at the same time. Defaults to 16.
+        :param fs: The object that performs the filesystem operations. It must have stat(path) and makedirs(path,
+               exist_ok) functions that behave like the ones in the os module. Defaults to the os module.
+        :param max_cached_stats: The most stat results to cache. The ones used the longest time ago are dropped first.
+               If None, every stat result is cached for the rest of the run. Defaults to None.
+        """
+
+        self.concurrency = max(concurrency, 1)
+        self.fs = fs
+
+        self.stats = LRUCache(max_cached_stats)
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    async def _gather(self,
+                      fn,
+                      items):
+        """
+        Calls fn on each item, keeping up to self.concurrency calls in flight at a time. The calls are scheduled in
+        chunks, so that a very long list of items does not create all of its tasks at once.
+
+        :param fn: The function to call.
+        :param items: The list of items to call it on.
+
+        :return: The list of results, in the same order as items. A call that raised has its exception as its result.
+        """
+
+        loop = asyncio.get_running_loop()
+        chunk_size = self.concurrency * 16
+
+        results = list()
+        for start in range(0, len(items), chunk_size):
+            results.extend(await asyncio.gather(*[loop.run_in_executor(self.executor, fn, item)
+                                                  for item in items[start:start + chunk_size]],
+                                                return_exceptions=True))
+
+        return results
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def map(self,
+            fn,
+            items):
+        """
+        Calls fn on each item concurrently and waits for all of the calls to finish.
+
+        :param fn: The function to call. It is run in a worker thread.
+        :param items: An iterable of items to call it on.
+
+        :return: The list of results, in the same order as items. A call that raised has its exception as its result.
+        """
+
+        items = list(items)
+        if not items:
+            return list()
+
+        return asyncio.run(self._gather(fn, items))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _stat(self,
+              path):
+        """
+        Stats a path and caches the result.
+
+        :param path: The path to stat.
+
+        :return: The stat result, or None if the path does not exist.
+        """
+
+        try:
+            stat_result = self.fs.stat(path)
+        except FileNotFoundError:
+            stat_result = None
+
+        with self.lock:
+            self.stats[path] = stat_result
+
+        return stat_result
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def prefetch_stats(self,
+                       paths):
+        """
+        Stats all of the paths that are not cached yet at the same time, and caches the results.
+
+        :param paths: An iterable of paths.
+
+        :return: Nothing.
+        """
+
+        with self.lock:
+            missing = [path for path in set(paths) if path not in self.stats]
+
+        self.map(self._stat, missing)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def stat(self,
+             path):
+        """
+        Returns the stat result of a path, from the cache if it has already been stat-ed in this run.
+
+        :param path: The path to stat.
+
+        :return: The stat result.
+        """
+
+        try:
+            stat_result = self.stats[path]
+        except KeyError:
+            stat_result = self._stat(path)
+
+        if stat_result is None:
+            raise FileNotFoundError(path)
+
+        return stat_result
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def exists(self,
+               path):
+        """
+        Checks whether a path exists, from the cache if it has already been stat-ed in this run.
+
+        :param path: The path to check.
+
+        :return: True if the path exists, False otherwise.
+        """
+
+        try:
+            self.stat(path)
+        except OSError:
+            return False
+
+        return True
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def getsize(self,
+                path):
+        """
+        Returns the size of a file, from the cache if it has already been stat-ed in this run.
+
+        :param path: The path to the file.
+
+        :return: The size in bytes.
+        """
+
+        return self.stat(path).st_size
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def forget(self,
+               path):
+        """
+        Drops a path from the cache, for when it has been changed.
+
+        :param path: The path.
+
+        :return: Nothing.
+        """
+
+        with self.lock:
+            self.stats.pop(path, None)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def makedirs(self,
+                 dir_paths):
+        """
+        Creates all of the directories at the same time (and any of their parents that are missing). Directories that
+        are already known to exist are skipped.
+
+        Parents are created before their children, one level of depth at a time, so that no two workers race to create
+        the same parent.
+
+        :param dir_paths: An iterable of directory paths.
+
+        :return: A list of (directory path, exception) tuples for the directories that could not be created.
+        """
+
+        wanted = set()
+        for dir_path in dir_paths:
+            while dir_path and dir_path not in wanted:
+                wanted.add(dir_path)
+                parent = os.path.dirname(dir_path)
+                if parent == dir_path:
+                    break
+                dir_path = parent
+
+        self.prefetch_stats(wanted)
+
+        by_depth = dict()
+        for dir_path in wanted:
+            if self.stats.get(dir_path) is None:
+                by_depth.setdefault(dir_path.count(os.sep), list()).append(dir_path)
+
+        def make(dir_path):
+            self.fs.makedirs(dir_path, exist_ok=True)
+
+        errors = list()
+        for depth in sorted(by_depth.keys()):
+            results = self.map(make, by_depth[depth])
+            for dir_path, result in zip(by_depth[depth], results):
+                self.forget(dir_path)
+                if isinstance(result, Exception):
+                    errors.append((dir_path, result))
+
+        return errors
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def close(self):
+        """
+        Stops the worker threads.
+
+        :return: Nothing.
+        """
+
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,39 @@
+import re
+
+from bvzcomparedirs.canonicalfiles import CanonicalFiles
+
+from src import verifiedcopy
+from src.checksumindex import STATE_DIR_NAME
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def scan_catalog_files(catalog_d,
+                       checksum_index=None):
+    """
+    Given the catalog directory, scan its contents. The directory where the catalog's own state files are stored is
+    skipped, as are the temporary files of copies that were interrupted.
+
+    :param catalog_d: The path to the catalog directory.
+    :param checksum_index: An optional checksum index object. If given, any entries for files that are no longer in the
+           catalog are removed from the index. Checksums for files that have changed since they were indexed are
+           recomputed the next time they are needed. Defaults to None.
+
+    :return: A canonicalfiles object.
+    """
+
+    canonicalfiles_obj = CanonicalFiles()
+    for counter in canonicalfiles_obj.scan_directory(catalog_d,
+                                                     skip_sub_dir=False,
+                                                     skip_hidden=False,
+                                                     skip_zero_len=True,
+                                                     incl_dir_regexes=None,
+                                                     excl_dir_regexes=[r"(^|/)" + re.escape(STATE_DIR_NAME) + r"(/|$)"],
+                                                     incl_file_regexes=None,
+                                                     excl_file_regexes=[re.escape(verifiedcopy.TEMP_SUFFIX) + r"$"],
+                                                     report_frequency=10):
+        pass
+
+    if checksum_index is not None:
+        checksum_index.prune(canonicalfiles_obj.files)
+
+    return canonicalfiles_obj
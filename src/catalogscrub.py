@@ -0,0 +1,277 @@
+import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from src import runreport
+from src import verifiedcopy
+from src.catalogfiles import scan_catalog_files
+from src.devicelanes import round_robin
+from src.ratelimit import TokenBucket
+
+
+class CatalogScrub(object):
+    """
+    A class to check the files in the catalog for bit rot: every file is read again and its checksum compared with the
+    one stored in the checksum index when it was imported (or last hashed).
+
+    The files that have gone the longest without being checked are checked first, and every check is recorded in the
+    index as it is made. A scrub can therefore be stopped at any time (or limited to a number of files, bytes or
+    minutes per run) and the next one simply carries on with the files that are now the least recently checked. Files
+    in the catalog that have no checksum yet are hashed as well, so that later scrubs have something to compare them
+    with. They take turns with the checks of the least recently checked files, so that a scrub with a limit still
+    re-checks old files on a catalog where many files have never been hashed.
+
+    Files are read by several threads at the same time, optionally capped to a maximum number of bytes per second so
+    that a scrub can run while the catalog is in use.
+    """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self,
+                 catalog_path,
+                 checksum_index,
+                 notify_obj,
+                 jobs=1,
+                 max_bytes_per_s=None):
+        """
+        Sets up the scrub.
+
+        :param catalog_path: The full path where the image catalog lives.
+        :param checksum_index: The checksum index of the catalog.
+        :param notify_obj: A notification object.
+        :param jobs: The number of files to read at the same time. Defaults to 1.
+        :param max_bytes_per_s: The maximum number of bytes to read per second, shared by all of the jobs. If None,
+               files are read as fast as possible. Defaults to None.
+        """
+
+        self.catalog_path = catalog_path
+        self.checksum_index = checksum_index
+        self.notify_obj = notify_obj
+        self.jobs = max(jobs, 1)
+
+        self.rate_limiter = None
+        if max_bytes_per_s:
+            self.rate_limiter = TokenBucket(max_bytes_per_s)
+
+        self.num_checked = 0
+        self.num_verified = 0
+        self.num_added = 0
+        self.num_bytes = 0
+        self.corrupt = list()
+        self.changed = list()
+        self.missing = list()
+        self.unreadable = list()
+        self.budget_exhausted = False
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _digest(self,
+                file_p,
+                hash_algorithm):
+        """
+        Reads a file and returns its checksum, charging the bytes read to the rate limiter.
+
+        :param file_p: The path to the file.
+        :param hash_algorithm: The hash algorithm to use.
+
+        :return: The checksum.
+        """
+
+        return verifiedcopy.digest_for_file(file_p, hash_algorithm, rate_limiter=self.rate_limiter)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _add(self,
+             file_p):
+        """
+        Hashes a catalog file that has no checksum yet and adds it to the index. Runs in a worker thread.
+
+        :param file_p: The path to the file.
+
+        :return: A tuple of ("added", the path, the number of bytes read).
+        """
+
+        stat_result = os.stat(file_p)
+        digest = self._digest(file_p, self.checksum_index.hash_algorithm)
+        self.checksum_index.store(file_p, digest, stat_result)
+
+        return "added", file_p, stat_result.st_size
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _verify(self,
+                entry):
+        """
+        Checks a single index entry against the file on disk. Runs in a worker thread.
+
+        A file whose size, modification time or inode no longer match the entry has been changed on purpose (or
+        replaced) since it was hashed. Its new checksum is stored and it is reported as changed. A file that has not
+        been touched but whose contents no longer match its checksum is corrupt. Its entry is left as it is, so that it
+        is reported again (and checked first) until it is dealt with.
+
+        :param entry: A (relative path, size, modification time, inode, digest, algorithm, last verified time) tuple.
+
+        :return: A tuple of (the status: "verified", "changed" or "corrupt", the path, the number of bytes read).
+        """
+
+        rel_path, size, mtime_ns, inode, digest, hash_algorithm, last_verified = entry
+        file_p = os.path.join(self.catalog_path, rel_path)
+
+        stat_result = os.stat(file_p)
+        if (stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino) != (size, mtime_ns, inode):
+            new_digest = self._digest(file_p, self.checksum_index.hash_algorithm)
+            self.checksum_index.store(file_p, new_digest, stat_result)
+            return "changed", file_p, stat_result.st_size
+
+        if self._digest(file_p, hash_algorithm) != digest:
+            return "corrupt", file_p, stat_result.st_size
+
+        self.checksum_index.mark_verified(rel_path)
+        return "verified", file_p, stat_result.st_size
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _iter_work(self,
+                   new_paths,
+                   verified_before,
+                   max_files,
+                   max_bytes,
+                   max_seconds):
+        """
+        Generates the work to do: the files that have no checksum yet take turns with the index entries, least recently
+        verified first, so that a limited scrub spends its budget on both. Stops once any of the limits has been
+        reached.
+
+        :param new_paths: The list of catalog files that have no checksum yet.
+        :param verified_before: Only entries last verified before this time are checked.
+        :param max_files: The maximum number of files to read, or None.
+        :param max_bytes: The maximum number of bytes to read, or None.
+        :param max_seconds: The maximum number of seconds to spend starting new files, or None.
+
+        :return: A generator of (function, argument, path of the file) tuples.
+        """
+
+        start = time.monotonic()
+        num_files = 0
+        num_bytes = 0
+
+        def add_work():
+            for new_path in new_paths:
+                try:
+                    yield self._add, new_path, new_path, os.path.getsize(new_path)
+                except OSError:
+                    continue
+
+        def verify_work():
+            for entry in self.checksum_index.iter_least_recently_verified(verified_before):
+                yield self._verify, entry, os.path.join(self.catalog_path, entry[0]), entry[1]
+
+        for function, argument, file_p, size in round_robin([add_work(), verify_work()]):
+            if ((max_files is not None and num_files >= max_files) or
+                    (max_bytes is not None and num_bytes >= max_bytes) or
+                    (max_seconds is not None and time.monotonic() - start >= max_seconds)):
+                self.budget_exhausted = True
+                return
+            num_files += 1
+            num_bytes += size
+            yield function, argument, file_p
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _check(self,
+               function,
+               argument,
+               file_p):
+        """
+        Runs a single check in a worker thread. Errors are returned rather than raised, so that a file that cannot be
+        read (or whose result cannot be written to the index because another process holds it for too long) is
+        reported on its own instead of ending the scrub.
+
+        :param function: Either self._add or self._verify.
+        :param argument: The argument to pass to the function.
+        :param file_p: The path of the file being checked.
+
+        :return: A tuple of (the status, the path, the number of bytes read, the error or None).
+        """
+
+        try:
+            status, file_p, num_bytes = function(argument)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            return "unreadable", file_p, 0, e
+
+        return status, file_p, num_bytes, None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _record(self,
+                future):
+        """
+        Records the result of a single check.
+
+        :param future: The future of the check.
+
+        :return: Nothing.
+        """
+
+        status, file_p, num_bytes, error = future.result()
+
+        self.num_checked += 1
+        self.num_bytes += num_bytes
+        if status == "unreadable":
+            self.unreadable.append((file_p, error))
+        elif status == "added":
+            self.num_added += 1
+        elif status == "changed":
+            self.changed.append(file_p)
+        elif status == "corrupt":
+            self.corrupt.append(file_p)
+            runreport.count("scrub_corrupt")
+        else:
+            self.num_verified += 1
+
+        self.notify_obj.notify("(%d) %s: %s", self.num_checked, status.capitalize(), file_p)
+        self.notify_obj.progress("scrub", num_bytes=num_bytes)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def run(self,
+            verified_before=None,
+            max_files=None,
+            max_bytes=None,
+            max_seconds=None):
+        """
+        Runs the scrub.
+
+        :param verified_before: Only files last verified before this time are checked. Files that have no checksum yet
+               are always hashed. Defaults to the time the scrub started (every file is checked once).
+        :param max_files: The maximum number of files to read in this run. Defaults to None (no limit).
+        :param max_bytes: The maximum number of bytes to read in this run. Defaults to None (no limit).
+        :param max_seconds: The maximum number of seconds to spend starting to read new files. Defaults to None (no
+               limit).
+
+        :return: True if no file was found to be corrupt or could not be read, False otherwise.
+        """
+
+        if verified_before is None or verified_before > time.time():
+            verified_before = time.time()
+
+        self.notify_obj.notify("Scanning the catalog: %s", self.catalog_path, summary=True)
+        catalogfiles_obj = scan_catalog_files(self.catalog_path)
+
+        # Files that have an entry but are no longer in the catalog have been deleted (or lost).
+        for rel_path in self.checksum_index.prune(catalogfiles_obj.files):
+            self.missing.append(os.path.join(self.catalog_path, rel_path))
+
+        new_paths = sorted(self.checksum_index.unindexed(catalogfiles_obj.files))
+        del catalogfiles_obj
+
+        self.notify_obj.set_total("scrub", None)
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            pending = deque()
+            for function, argument, file_p in self._iter_work(new_paths,
+                                                              verified_before,
+                                                              max_files,
+                                                              max_bytes,
+                                                              max_seconds):
+                pending.append(executor.submit(self._check, function, argument, file_p))
+                if len(pending) >= self.jobs * 4:
+                    self._record(pending.popleft())
+            while pending:
+                self._record(pending.popleft())
+
+        return not self.corrupt and not self.unreadable
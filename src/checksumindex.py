@@ -0,0 +1,461 @@
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+from src import runreport
+from src import verifiedcopy
+
+STATE_DIR_NAME = ".importPhotos"
+INDEX_FILE_NAME = "checksums.db"
+
+
+class ChecksumIndex(object):
+    """
+    A persistent, on-disk index of the checksums of the files in the catalog. Each entry is keyed on the path of the
+    file relative to the catalog root and stores the size, modification time and inode of the file at the time it was
+    hashed, along with the name of the hash algorithm that was used. As long as these still match the file on disk
+    (and the algorithm is the one that was asked for), the stored digest is used instead of re-reading the file.
+
+    Each entry also records when the contents of the file were last known to match its digest (when it was hashed, or
+    when a scrub last re-read it), so that a scrub can check the files that have gone the longest without being checked
+    first.
+
+    The index may be shared between threads. All access to the database is serialized. It may also be shared between
+    processes (an import and a scrub of the same catalog, say): changes are committed in small batches (or after a
+    short time) so that no process holds the write lock for long, and a process that finds the index locked waits for
+    it. The database uses SQLite's rollback journal by default, which works on network filesystems. Write-ahead-log
+    mode (where readers never wait for a writer) may be turned on for catalogs on a local disk, but must not be used
+    for a catalog on SMB or NFS, where SQLite does not support it.
+
+    An index may also be opened read-only (for a trial run, which must not change anything on disk). Nothing is then
+    created or written: stored digests are still used, but new ones are not stored, and if there is no index yet it
+    behaves as an empty one.
+    """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self,
+                 catalog_path,
+                 commit_frequency=100,
+                 hash_algorithm=verifiedcopy.DEFAULT_HASH_ALGORITHM,
+                 commit_interval=1.0,
+                 busy_timeout=60.0,
+                 write_ahead_log=False,
+                 read_only=False):
+        """
+        Opens (and creates if needed, unless read_only is True) the index that lives at the root of the catalog.
+
+        :param catalog_path: The full path where the image catalog lives.
+        :param commit_frequency: How many changes to accumulate before committing them to disk. Defaults to 100.
+        :param hash_algorithm: The hash algorithm used for any digests this index computes. Entries that were hashed
+               with a different algorithm are kept, but are checked and re-hashed the first time they are needed (see
+               digest_for_file). Defaults to md5.
+        :param commit_interval: The most seconds a change may wait before it is committed, whatever the number of
+               changes. Defaults to 1.
+        :param busy_timeout: How many seconds to wait for another process that is writing to the index before giving
+               up with sqlite3.OperationalError. Defaults to 60.
+        :param write_ahead_log: If True, the database is kept in write-ahead-log mode. Only safe for a catalog on a
+               local disk. Defaults to False.
+        :param read_only: If True, the index is only read. Nothing is created or written. Defaults to False.
+        """
+
+        self.catalog_path = os.path.abspath(catalog_path)
+        self.commit_frequency = commit_frequency
+        self.hash_algorithm = hash_algorithm
+        self.commit_interval = commit_interval
+        self.pending_count = 0
+        self.last_commit = time.monotonic()
+        self.read_only = read_only
+
+        # Catalog files whose contents no longer match the digest they were stored with under another algorithm.
+        self.mismatches = list()
+
+        state_dir = os.path.join(self.catalog_path, STATE_DIR_NAME)
+        self.index_path = os.path.join(state_dir, INDEX_FILE_NAME)
+        self.lock = threading.Lock()
+
+        if read_only:
+            self.connection = self._connect_read_only(busy_timeout)
+            return
+
+        os.makedirs(state_dir, exist_ok=True)
+        self.connection = sqlite3.connect(self.index_path, timeout=busy_timeout, check_same_thread=False)
+        journal_mode = self.connection.execute("PRAGMA journal_mode").fetchone()[0].lower()
+        if write_ahead_log and journal_mode != "wal":
+            self.connection.execute("PRAGMA journal_mode=WAL")
+        elif not write_ahead_log and journal_mode == "wal":
+            # The mode is stored in the database itself, so an index that was opened in write-ahead-log mode before
+            # stays in it until it is switched back. That is only possible while no other process has it open. If
+            # one does, it is switched back by a later run.
+            try:
+                self.connection.execute("PRAGMA journal_mode=DELETE")
+            except sqlite3.OperationalError:
+                pass
+        self.connection.execute("CREATE TABLE IF NOT EXISTS checksums ("
+                                "rel_path TEXT PRIMARY KEY, "
+                                "size INTEGER NOT NULL, "
+                                "mtime_ns INTEGER NOT NULL, "
+                                "inode INTEGER NOT NULL, "
+                                "digest BLOB NOT NULL, "
+                                "algorithm TEXT NOT NULL DEFAULT 'md5', "
+                                "last_verified REAL NOT NULL DEFAULT 0)")
+
+        # Indexes written before the algorithm was recorded only ever held md5 digests. Entries written before the
+        # verification time was recorded count as never verified.
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(checksums)")]
+        if "algorithm" not in columns:
+            self.connection.execute("ALTER TABLE checksums ADD COLUMN algorithm TEXT NOT NULL DEFAULT 'md5'")
+        if "last_verified" not in columns:
+            self.connection.execute("ALTER TABLE checksums ADD COLUMN last_verified REAL NOT NULL DEFAULT 0")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS checksums_last_verified "
+                                "ON checksums (last_verified, rel_path)")
+        self.connection.commit()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _connect_read_only(self,
+                           busy_timeout):
+        """
+        Opens an existing index without being able to change it.
+
+        :param busy_timeout: How many seconds to wait for another process that is writing to the index.
+
+        :return: The connection, or None if there is no index (or it was written by an older version that did not
+                 record the hash algorithm and verification time, and would need to be upgraded to be read).
+        """
+
+        if not os.path.isfile(self.index_path):
+            return None
+
+        uri = "file:" + urllib.parse.quote(self.index_path) + "?mode=ro"
+        connection = sqlite3.connect(uri, uri=True, timeout=busy_timeout, check_same_thread=False)
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(checksums)")]
+        if "algorithm" not in columns or "last_verified" not in columns:
+            connection.close()
+            return None
+
+        return connection
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def relative_path(self,
+                      file_p):
+        """
+        Returns the path of the file relative to the catalog root, or None if the file does not live in the catalog.
+
+        :param file_p: The path to the file.
+
+        :return: The relative path, or None.
+        """
+
+        file_p = os.path.abspath(file_p)
+        if os.path.commonpath([self.catalog_path, file_p]) != self.catalog_path:
+            return None
+
+        return os.path.relpath(file_p, self.catalog_path)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _current_entry(self,
+                       rel_path,
+                       stat_result):
+        """
+        Returns the stored digest for a file and the algorithm it was made with, but only if the file has not changed
+        since it was hashed.
+
+        :param rel_path: The path of the file relative to the catalog root.
+        :param stat_result: An os.stat result for the file.
+
+        :return: A tuple of (digest, algorithm), or None if there is no valid entry for this file.
+        """
+
+        if self.connection is None:
+            return None
+
+        with self.lock:
+            row = self.connection.execute("SELECT size, mtime_ns, inode, digest, algorithm FROM checksums "
+                                          "WHERE rel_path = ?",
+                                          (rel_path,)).fetchone()
+        if row is None:
+            return None
+
+        if (row[0], row[1], row[2]) != (stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino):
+            return None
+
+        return row[3], row[4]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def lookup(self,
+               file_p,
+               stat_result=None,
+               hash_algorithm=None):
+        """
+        Returns the stored digest for the file, but only if the file has not changed since it was hashed and the digest
+        was made with the requested algorithm.
+
+        :param file_p: The path to the file.
+        :param stat_result: An optional os.stat result for the file, to avoid stat-ing it again.
+        :param hash_algorithm: The hash algorithm the digest must have been made with. Defaults to the index's
+               algorithm.
+
+        :return: The digest, or None if there is no valid entry for this file.
+        """
+
+        if hash_algorithm is None:
+            hash_algorithm = self.hash_algorithm
+
+        rel_path = self.relative_path(file_p)
+        if rel_path is None:
+            return None
+
+        if stat_result is None:
+            stat_result = os.stat(file_p)
+
+        entry = self._current_entry(rel_path, stat_result)
+        if entry is None or entry[1] != hash_algorithm:
+            return None
+
+        return entry[0]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def store(self,
+              file_p,
+              digest,
+              stat_result=None,
+              hash_algorithm=None):
+        """
+        Stores the digest for a file in the catalog. Files outside of the catalog are ignored, as is everything if the
+        index is read-only.
+
+        :param file_p: The path to the file.
+        :param digest: The digest of the file.
+        :param stat_result: An optional os.stat result for the file, to avoid stat-ing it again.
+        :param hash_algorithm: The hash algorithm the digest was made with. Defaults to the index's algorithm.
+
+        :return: Nothing.
+        """
+
+        if self.read_only:
+            return
+
+        if hash_algorithm is None:
+            hash_algorithm = self.hash_algorithm
+
+        rel_path = self.relative_path(file_p)
+        if rel_path is None:
+            return
+
+        if stat_result is None:
+            stat_result = os.stat(file_p)
+
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO checksums "
+                                    "(rel_path, size, mtime_ns, inode, digest, algorithm, last_verified) "
+                                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    (rel_path, stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino,
+                                     digest, hash_algorithm, time.time()))
+            self._changed()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def mark_verified(self,
+                      rel_path,
+                      verified_time=None):
+        """
+        Records that the contents of a file were found to still match its stored digest.
+
+        :param rel_path: The path of the file relative to the catalog root.
+        :param verified_time: When the file was verified. Defaults to now.
+
+        :return: Nothing.
+        """
+
+        if self.read_only:
+            return
+
+        if verified_time is None:
+            verified_time = time.time()
+
+        with self.lock:
+            self.connection.execute("UPDATE checksums SET last_verified = ? WHERE rel_path = ?",
+                                    (verified_time, rel_path))
+            self._changed()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def iter_least_recently_verified(self,
+                                     verified_before,
+                                     page_size=1000):
+        """
+        Generates the entries that were last verified before the given time, least recently verified first. The entries
+        are read a page at a time, so the whole index is never held in memory, and entries that are verified while the
+        generator is running are not generated again.
+
+        :param verified_before: Only entries last verified before this time are generated.
+        :param page_size: How many entries to read from the database at a time. Defaults to 1000.
+
+        :return: A generator of (relative path, size, modification time, inode, digest, algorithm, last verified time)
+                 tuples.
+        """
+
+        last_key = (-1.0, "")
+        while True:
+            with self.lock:
+                rows = self.connection.execute("SELECT rel_path, size, mtime_ns, inode, digest, algorithm, "
+                                               "last_verified FROM checksums "
+                                               "WHERE last_verified < ? AND (last_verified > ? OR "
+                                               "(last_verified = ? AND rel_path > ?)) "
+                                               "ORDER BY last_verified, rel_path LIMIT ?",
+                                               (verified_before, last_key[0], last_key[0], last_key[1],
+                                                page_size)).fetchall()
+            if not rows:
+                return
+
+            for row in rows:
+                yield row
+
+            last_key = (rows[-1][6], rows[-1][0])
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def unindexed(self,
+                  existing_paths):
+        """
+        Finds the files in the catalog that have no entry in the index.
+
+        :param existing_paths: An iterable of the full paths of the files in the catalog.
+
+        :return: A list of the full paths of the files that have no entry.
+        """
+
+        with self.lock:
+            indexed_rel_paths = set(row[0] for row in self.connection.execute("SELECT rel_path FROM checksums"))
+
+        unindexed_paths = list()
+        for existing_path in existing_paths:
+            rel_path = self.relative_path(existing_path)
+            if rel_path is not None and rel_path not in indexed_rel_paths:
+                unindexed_paths.append(existing_path)
+
+        return unindexed_paths
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def digest_for_file(self,
+                        file_p,
+                        block_size=2**20):
+        """
+        A drop-in replacement for verifiedcopy.digest_for_file (using the index's hash algorithm) that only reads the
+        file if the index does not already hold a valid digest for it. Any digest that is computed for a file in the
+        catalog is added to the index.
+
+        An entry that was made with a different algorithm is checked against the file before it is replaced. If the
+        file no longer matches it, the file is added to self.mismatches and its entry is left as it is (so that a scrub
+        reports it as corrupt too).
+
+        :param file_p: The path to the file we are getting a checksum for.
+        :param block_size: How much to read in in a single chunk. Defaults to 1MB
+
+        :return: The checksum.
+        """
+
+        # Files outside of the catalog are never in the index, so they are not counted as misses.
+        rel_path = self.relative_path(file_p)
+        if rel_path is None:
+            return verifiedcopy.digest_for_file(file_p, self.hash_algorithm, block_size)
+
+        stat_result = os.stat(file_p)
+        entry = self._current_entry(rel_path, stat_result)
+
+        if entry is not None and entry[1] == self.hash_algorithm:
+            runreport.count("checksum_index_hits")
+            return entry[0]
+        runreport.count("checksum_index_misses")
+
+        if entry is None or entry[1] not in verifiedcopy.HASH_ALGORITHMS:
+            digest = verifiedcopy.digest_for_file(file_p, self.hash_algorithm, block_size)
+            self.store(file_p, digest, stat_result)
+            return digest
+
+        # The entry is current but was made with another algorithm. Check the file against it before replacing it,
+        # so that changing the algorithm does not hide any corruption since the file was hashed. Both checksums are
+        # computed in a single read.
+        old_digest, digest = verifiedcopy.digests_for_file(file_p, [entry[1], self.hash_algorithm], block_size)
+        if old_digest != entry[0]:
+            runreport.count("checksum_index_mismatches")
+            with self.lock:
+                self.mismatches.append(file_p)
+            return digest
+
+        self.store(file_p, digest, stat_result)
+
+        return digest
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def prune(self,
+              existing_paths):
+        """
+        Removes the entries for any files that are no longer in the catalog.
+
+        The list of existing files may be out of date by the time it is used: another process (an import running at
+        the same time as a scrub, say) may have copied files into the catalog and stored their checksums since it was
+        made. An entry that is not in the list is therefore only removed if its file no longer exists on disk.
+
+        :param existing_paths: An iterable of the full paths of the files known to exist in the catalog.
+
+        :return: A list of the relative paths of the entries that were removed. Always empty if the index is
+                 read-only.
+        """
+
+        if self.read_only:
+            return list()
+
+        existing_rel_paths = set()
+        for existing_path in existing_paths:
+            rel_path = self.relative_path(existing_path)
+            if rel_path is not None:
+                existing_rel_paths.add(rel_path)
+
+        with self.lock:
+            candidates = [row[0] for row in self.connection.execute("SELECT rel_path FROM checksums")
+                          if row[0] not in existing_rel_paths]
+
+        stale = list()
+        for rel_path in candidates:
+            try:
+                os.lstat(os.path.join(self.catalog_path, rel_path))
+            except FileNotFoundError:
+                stale.append((rel_path,))
+
+        if stale:
+            with self.lock:
+                self.connection.executemany("DELETE FROM checksums WHERE rel_path = ?", stale)
+                self.connection.commit()
+
+        return [row[0] for row in stale]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _changed(self):
+        """
+        Counts a change and commits once enough changes have accumulated, or once the oldest of them has waited long
+        enough. Must be called with the lock held.
+
+        :return: Nothing.
+        """
+
+        self.pending_count += 1
+        now = time.monotonic()
+        if self.pending_count >= self.commit_frequency or now - self.last_commit >= self.commit_interval:
+            self.connection.commit()
+            self.pending_count = 0
+            self.last_commit = now
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def close(self):
+        """
+        Commits any outstanding changes and closes the index.
+
+        :return: Nothing.
+        """
+
+        if self.connection is None:
+            return
+
+        with self.lock:
+            if not self.read_only:
+                self.connection.commit()
+            self.connection.close()
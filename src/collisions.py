@@ -16,3 +16,7 @@ class Collisions(object):
         self.source_sidecar_collision_different = list()
         self.destination_sidecar_exists_identical = list()
         self.destination_sidecar_exists_different = list()
+
+        # A list of (source path, catalog path) tuples for images whose contents already exist somewhere in the catalog
+        # under a different path.
+        self.catalog_image_exists_elsewhere = list()
@@ -0,0 +1,253 @@
+import json
+import os
+import threading
+
+from src import verifiedcopy
+from src.checksumindex import STATE_DIR_NAME
+
+JOURNAL_FILE_NAME = "journal.log"
+
+
+class CopyJournal(object):
+    """
+    An append-only journal of the copies made by an import, kept in the catalog's state directory. Every image is
+    recorded once when it is handed to the copy and again once it (and its sidecar) has been copied and verified, along
+    with the checksums and the size and modification time of the source and destination files.
+
+    If an import is interrupted, the next import can resume from the journal: images whose copy was completed (and whose
+    source and destination files have not changed since) are skipped without being read again. Because files are copied
+    to a temporary name and only renamed once verified, an image that was planned but never completed leaves nothing
+    behind but its temporary files, which are removed by the next import (whether it resumes or not).
+
+    Each record is a single line of JSON. A line that was only partly written when the import was interrupted is
+    ignored. Every completed copy is flushed to disk with fsync before the import moves on, so that a crash never loses
+    the record of a copy that was finished.
+
+    The journal may be shared between threads. All writes are serialized.
+    """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self,
+                 catalog_path,
+                 resume=False):
+        """
+        Opens the journal. Unless resuming, any journal left behind by an earlier import is discarded, but the copies it
+        planned are still loaded so that their temporary files can be removed (see remove_partial_files).
+
+        :param catalog_path: The full path where the image catalog lives.
+        :param resume: If True, the records of the earlier import are loaded and new records are appended to them.
+               Defaults to False.
+        """
+
+        state_dir = os.path.join(os.path.abspath(catalog_path), STATE_DIR_NAME)
+        os.makedirs(state_dir, exist_ok=True)
+        self.journal_path = os.path.join(state_dir, JOURNAL_FILE_NAME)
+
+        self.planned = dict()
+        self.completed = dict()
+        self._load()
+        if not resume:
+            for source_path in self.completed:
+                self.planned.pop(source_path, None)
+            self.completed = dict()
+
+        self.lock = threading.Lock()
+        self.journal_file = open(self.journal_path, "a" if resume else "w")
+
+        # Terminate a line that was only partly written, so that it does not swallow the first new record.
+        if resume and self.journal_file.tell() > 0:
+            with open(self.journal_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self.journal_file.write("\n")
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _load(self):
+        """
+        Reads the records of an earlier import, keyed on the source path.
+
+        :return: Nothing.
+        """
+
+        if not os.path.exists(self.journal_path):
+            return
+
+        with open(self.journal_path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("event") == "planned":
+                    self.planned[record["source"]] = record
+                elif record.get("event") == "done":
+                    self.completed[record["source"]] = record
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @staticmethod
+    def _stat_matches(file_p,
+                      size,
+                      mtime_ns):
+        """
+        Checks that a file still exists with the given size and modification time.
+
+        :param file_p: The path to the file.
+        :param size: The expected size.
+        :param mtime_ns: The expected modification time in nanoseconds.
+
+        :return: True if the file exists and matches, False otherwise.
+        """
+
+        try:
+            stat_result = os.stat(file_p)
+        except OSError:
+            return False
+
+        return stat_result.st_size == size and stat_result.st_mtime_ns == mtime_ns
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def is_complete(self,
+                    source_path):
+        """
+        Checks whether an earlier import already copied and verified this source file. Only the sizes and modification
+        times of the files are checked. The file contents are not read.
+
+        :param source_path: The path to the source file.
+
+        :return: True if the copy was completed and neither the source nor the copies have changed since.
+        """
+
+        record = self.completed.get(os.path.abspath(source_path))
+        if record is None:
+            return False
+
+        if not self._stat_matches(record["source"], record["source_size"], record["source_mtime_ns"]):
+            return False
+
+        if not self._stat_matches(record["dest"], record["dest_size"], record["dest_mtime_ns"]):
+            return False
+
+        if record["sidecar_dest"] is not None:
+            if not self._stat_matches(record["sidecar_dest"], record["sidecar_dest_size"],
+                                      record["sidecar_dest_mtime_ns"]):
+                return False
+
+        return True
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def remove_partial_files(self):
+        """
+        Removes the temporary files left behind by the copies of the earlier import that were planned but never
+        completed. Should be called on every import, not just when resuming, as the journal of the earlier import is
+        discarded otherwise.
+
+        :return: The number of files that were removed.
+        """
+
+        num_removed = 0
+        for source_path, record in self.planned.items():
+            if source_path in self.completed:
+                continue
+            for dest_path in (record["dest"], record["sidecar_dest"]):
+                if dest_path is None:
+                    continue
+                temp_path = verifiedcopy.temp_path_for(dest_path)
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                    num_removed += 1
+
+        return num_removed
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _write(self,
+               record,
+               sync=False):
+        """
+        Appends a record to the journal.
+
+        :param record: The dictionary to write.
+        :param sync: If True, the journal is flushed to disk with fsync before returning. Defaults to False.
+
+        :return: Nothing.
+        """
+
+        with self.lock:
+            self.journal_file.write(json.dumps(record) + "\n")
+            self.journal_file.flush()
+            if sync:
+                os.fsync(self.journal_file.fileno())
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def record_planned(self,
+                       image_obj):
+        """
+        Records that an image is about to be copied.
+
+        :param image_obj: The image object.
+
+        :return: Nothing.
+        """
+
+        self._write({"event": "planned",
+                     "source": os.path.abspath(image_obj.source_path),
+                     "dest": image_obj.dest_path,
+                     "sidecar_dest": image_obj.sidecar_dest_path})
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def record_completed(self,
+                         image_obj,
+                         hash_algorithm):
+        """
+        Records that an image (and its sidecar, if any) has been copied and verified.
+
+        :param image_obj: The image object.
+        :param hash_algorithm: The hash algorithm of the image's digests.
+
+        :return: Nothing.
+        """
+
+        source_stat = os.stat(image_obj.source_path)
+        dest_stat = os.stat(image_obj.dest_path)
+
+        record = {"event": "done",
+                  "source": os.path.abspath(image_obj.source_path),
+                  "source_size": source_stat.st_size,
+                  "source_mtime_ns": source_stat.st_mtime_ns,
+                  "dest": image_obj.dest_path,
+                  "dest_size": dest_stat.st_size,
+                  "dest_mtime_ns": dest_stat.st_mtime_ns,
+                  "digest": image_obj.digest.hex(),
+                  "algorithm": hash_algorithm,
+                  "sidecar_dest": None}
+
+        if image_obj.sidecar_path:
+            sidecar_dest_stat = os.stat(image_obj.sidecar_dest_path)
+            record["sidecar_dest"] = image_obj.sidecar_dest_path
+            record["sidecar_dest_size"] = sidecar_dest_stat.st_size
+            record["sidecar_dest_mtime_ns"] = sidecar_dest_stat.st_mtime_ns
+            record["sidecar_digest"] = image_obj.sidecar_digest.hex()
+
+        self._write(record, sync=True)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def close(self,
+              remove=False):
+        """
+        Flushes the journal to disk and closes it. Does nothing if the journal is already closed.
+
+        :param remove: If True, the journal is deleted (because the import finished and there is nothing to resume).
+               Defaults to False.
+
+        :return: Nothing.
+        """
+
+        with self.lock:
+            if self.journal_file is None:
+                return
+            self.journal_file.flush()
+            os.fsync(self.journal_file.fileno())
+            self.journal_file.close()
+            self.journal_file = None
+
+        if remove:
+            os.remove(self.journal_path)
@@ -0,0 +1,274 @@
+import os
+import threading
+
+from src import runreport
+from src import verifiedcopy
+from src.devicelanes import DeviceLanes
+
+
+class CopyScheduler(object):
+    """
+    A class to copy a list of image objects to the catalog using several copy/verify workers at the same time. Each
+    image is copied together with its sidecar file as a single unit. The total size of the units that are being copied at
+    any one time is capped so that a large number of big files do not all compete for the disks at once. The number of
+    units waiting for a worker is capped as well, so that memory use does not depend on the number of images.
+    """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self,
+                 notify_obj,
+                 jobs=1,
+                 max_in_flight_bytes=2**30,
+                 checksum_index=None,
+                 copy_mode="python",
+                 trial=False,
+                 retries=0,
+                 journal=None,
+                 source_index=None,
+                 device_lanes=None,
+                 async_fs=None):
+        """
+        Sets up the scheduler.
+
+        :param notify_obj: A notification object.
+        :param jobs: The number of images to copy at the same time. Defaults to 1.
+        :param max_in_flight_bytes: The maximum number of bytes being copied at the same time. A single image that is
+               larger than this is still copied, but only on its own. Defaults to 1GB.
+        :param checksum_index: An optional checksum index object where the checksums of the copied files will be
+               recorded. Defaults to None.
+        :param copy_mode: The copy backend to use. See verifiedcopy.copy_file for the list of options. Defaults to
+               "python".
+        :param trial: If True, then the copies will be reported but not actually made. Defaults to False.
+        :param retries: How many times to retry an image whose copy or verification failed before giving up on it.
+               Defaults to 0.
+        :param journal: An optional copy journal object in which every image is recorded when it is handed to a worker
+               and again once it has been copied and verified. Defaults to None.
+        :param source_index: An optional source index object in which the source files are recorded once they have been
+               copied and verified, so that later imports can skip them. Defaults to None.
+        :param device_lanes: An optional device lanes object. If given, each image is copied in the lane of the device
+               its source file lives on, so that images from different devices are copied at the same time and each
+               device is only read by as many workers as suit it. If None, all of the images are copied by a single
+               pool of jobs workers. Defaults to None.
+        :param async_fs: An optional async filesystem object. If given (and the images are given as a list), all of the
+               destination directories are created at the same time before the copy starts. Defaults to None.
+        """
+
+        self.notify_obj = notify_obj
+        self.jobs = jobs
+        self.max_in_flight_bytes = max_in_flight_bytes
+        self.checksum_index = checksum_index
+        self.copy_mode = copy_mode
+        self.trial = trial
+        self.retries = retries
+        self.journal = journal
+        self.source_index = source_index
+
+        if device_lanes is None:
+            device_lanes = DeviceLanes(jobs, by_device=False)
+        self.device_lanes = device_lanes
+        self.async_fs = async_fs
+
+        self.in_flight_bytes = 0
+        self.in_flight_units = 0
+        self.condition = threading.Condition()
+
+        self.num_done = 0
+        self.num_total = None
+
+        self.created_dirs = set()
+
+        self.backend_counts = dict()
+        self.errors = list()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @staticmethod
+    def unit_size(image_obj):
+        """
+        Returns the number of bytes that will be copied for an image and its sidecar.
+
+        :param image_obj: The image object.
+
+        :return: The size in bytes.
+        """
+
+        size = os.path.getsize(image_obj.source_path)
+        if image_obj.sidecar_path:
+            size += os.path.getsize(image_obj.sidecar_path)
+
+        return size
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def make_dest_dirs(self,
+                       image_obj):
+        """
+        Creates the destination directories for an image and its sidecar. Each directory is only created once per run,
+        so that the workers do not have to.
+
+        :param image_obj: The image object that will be copied.
+
+        :return: Nothing.
+        """
+
+        dest_dirs = [os.path.split(image_obj.dest_path)[0]]
+        if image_obj.sidecar_dest_path:
+            dest_dirs.append(os.path.split(image_obj.sidecar_dest_path)[0])
+
+        for dest_dir in dest_dirs:
+            if dest_dir not in self.created_dirs:
+                os.makedirs(dest_dir, exist_ok=True)
+                self.created_dirs.add(dest_dir)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def make_all_dest_dirs(self,
+                           image_objects):
+        """
+        Creates the destination directories of all of the images at the same time. Any directory that cannot be created
+        is left to make_dest_dirs, which tries again (and reports the error) for each image that needs it.
+
+        :param image_objects: The list of image objects that will be copied.
+
+        :return: Nothing.
+        """
+
+        dest_dirs = set()
+        for image_obj in image_objects:
+            dest_dirs.add(os.path.split(image_obj.dest_path)[0])
+            if image_obj.sidecar_dest_path:
+                dest_dirs.add(os.path.split(image_obj.sidecar_dest_path)[0])
+
+        failed_dirs = set(dest_dir for dest_dir, error in self.async_fs.makedirs(dest_dirs))
+        self.created_dirs.update(dest_dirs - failed_dirs)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _acquire(self,
+                 num_bytes):
+        """
+        Waits until there is room for another unit of num_bytes bytes to be in flight, then reserves it.
+
+        :param num_bytes: The number of bytes to reserve.
+
+        :return: Nothing.
+        """
+
+        # There is a lane per device, created as new devices are seen, so the number of workers can grow during the run.
+        max_in_flight_units = max(self.jobs, self.device_lanes.num_workers) * 4
+
+        with self.condition:
+            while self.in_flight_units > 0 and (self.in_flight_units >= max_in_flight_units or
+                                                self.in_flight_bytes + num_bytes > self.max_in_flight_bytes):
+                self.condition.wait()
+            self.in_flight_bytes += num_bytes
+            self.in_flight_units += 1
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _release(self,
+                 num_bytes):
+        """
+        Releases a unit that was previously reserved.
+
+        :param num_bytes: The number of bytes to release.
+
+        :return: Nothing.
+        """
+
+        with self.condition:
+            self.in_flight_bytes -= num_bytes
+            self.in_flight_units -= 1
+            self.condition.notify_all()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _copy_unit(self,
+                   image_obj,
+                   num_bytes):
+        """
+        Copies a single image and its sidecar. Any error is recorded rather than raised.
+
+        :param image_obj: The image object to copy.
+        :param num_bytes: The number of bytes that were reserved for this image.
+
+        :return: Nothing.
+        """
+
+        try:
+            attempt = 0
+            while True:
+                try:
+                    image_obj.copy_to_dest(trial=self.trial,
+                                           checksum_index=self.checksum_index,
+                                           copy_mode=self.copy_mode,
+                                           make_dirs=False)
+                    break
+                except OSError:
+                    if attempt >= self.retries:
+                        raise
+                    attempt += 1
+                    runreport.count("copy_retries")
+
+            # This runs in a worker whose future is not kept, so a failure to record the copy has to be caught here too
+            # or it would be lost (and the image counted as imported).
+            if self.journal is not None and not self.trial:
+                hash_algorithm = verifiedcopy.DEFAULT_HASH_ALGORITHM
+                if self.checksum_index is not None:
+                    hash_algorithm = self.checksum_index.hash_algorithm
+                self.journal.record_completed(image_obj, hash_algorithm)
+            if self.source_index is not None and not self.trial:
+                self.source_index.record(image_obj.source_path, image_obj.sidecar_path)
+        except Exception as e:
+            with self.condition:
+                self.errors.append((image_obj, e))
+        else:
+            with self.condition:
+                for backend in (image_obj.copy_backend, image_obj.sidecar_copy_backend):
+                    if backend is not None:
+                        self.backend_counts[backend] = self.backend_counts.get(backend, 0) + 1
+        finally:
+            self._release(num_bytes)
+            with self.condition:
+                self.num_done += 1
+                num_done = self.num_done
+            if self.num_total is None:
+                self.notify_obj.notify("(%d) Done: %s", num_done, image_obj.source_path)
+            else:
+                self.notify_obj.notify("(%d of %d) Done: %s", num_done, self.num_total, image_obj.source_path)
+            self.notify_obj.progress("copy", num_bytes=num_bytes)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def run(self,
+            image_objects):
+        """
+        Copies all of the image objects. Errors do not stop the other copies. They are collected in self.errors as a
+        list of (image object, exception) tuples.
+
+        image_objects may also be a generator. Images are only pulled from it when there is room for them to be copied,
+        so the stages that produce them are held back by the copy.
+
+        :param image_objects: The list (or any other iterable) of image objects to copy.
+
+        :return: The list of errors.
+        """
+
+        try:
+            self.num_total = len(image_objects)
+        except TypeError:
+            self.num_total = None
+        self.notify_obj.set_total("copy", self.num_total)
+
+        if self.async_fs is not None and self.num_total is not None and not self.trial:
+            self.make_all_dest_dirs(image_objects)
+
+        with self.device_lanes:
+            for image_obj in image_objects:
+                try:
+                    num_bytes = self.unit_size(image_obj)
+                    if not self.trial:
+                        self.make_dest_dirs(image_obj)
+                except OSError as e:
+                    with self.condition:
+                        self.errors.append((image_obj, e))
+                    continue
+                self._acquire(num_bytes)
+                if self.journal is not None and not self.trial:
+                    self.journal.record_planned(image_obj)
+                self.device_lanes.submit(image_obj.source_path, self._copy_unit, image_obj, num_bytes)
+
+        return self.errors
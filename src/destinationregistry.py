@@ -0,0 +1,73 @@
+import os
+import sqlite3
+import tempfile
+
+
+class DestinationRegistry(object):
+    """
+    A class to remember which destination paths have already been claimed by the files being imported, and by which
+    source file. The registry lives in a temporary SQLite database rather than in memory, so memory use stays flat no
+    matter how many files are imported.
+    """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self,
+                 temp_dir=None):
+        """
+        Creates an empty registry.
+
+        :param temp_dir: The directory where the temporary database is created. Defaults to the system temp dir.
+        """
+
+        file_descriptor, self.registry_path = tempfile.mkstemp(prefix="importPhotos_", suffix=".db", dir=temp_dir)
+        os.close(file_descriptor)
+
+        self.connection = sqlite3.connect(self.registry_path)
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute("CREATE TABLE destinations (dest_path TEXT PRIMARY KEY, source_path TEXT NOT NULL)")
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def get(self,
+            dest_path):
+        """
+        Returns the source path that has claimed a destination.
+
+        :param dest_path: The destination path.
+
+        :return: The source path, or None if the destination has not been claimed.
+        """
+
+        row = self.connection.execute("SELECT source_path FROM destinations WHERE dest_path = ?",
+                                      (dest_path,)).fetchone()
+        if row is None:
+            return None
+
+        return row[0]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def add(self,
+            dest_path,
+            source_path):
+        """
+        Claims a destination for a source file.
+
+        :param dest_path: The destination path.
+        :param source_path: The source path.
+
+        :return: Nothing.
+        """
+
+        self.connection.execute("INSERT OR REPLACE INTO destinations (dest_path, source_path) VALUES (?, ?)",
+                                (dest_path, source_path))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def close(self):
+        """
+        Closes and deletes the registry.
+
+        :return: Nothing.
+        """
+
+        self.connection.close()
+        os.remove(self.registry_path)
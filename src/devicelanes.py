@@ -0,0 +1,230 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Where Linux keeps a symlink per block device (named major:minor), pointing at the device's directory in sysfs.
+SYS_DEV_BLOCK_DIR = "/sys/dev/block"
+
+# Device names of SD and other memory cards that are read through a built-in card reader.
+CARD_DEVICE_PREFIXES = ("mmcblk",)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _read_sys_flag(file_p):
+    """
+    Reads a 0/1 flag from a sysfs file.
+
+    :param file_p: The path to the sysfs file.
+
+    :return: True or False, or None if the file could not be read.
+    """
+
+    try:
+        with open(file_p, "r") as f:
+            return f.read().strip() == "1"
+    except (OSError, ValueError):
+        return None
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def device_kind(device):
+    """
+    Works out what kind of disk a device is from the information Linux keeps about it in sysfs.
+
+    :param device: The device number (st_dev) of a file on the device.
+
+    :return: "rotational" for a spinning disk, "removable" for a memory card or any other removable device, "ssd" for
+             any other block device, or None if it is not a block device that can be looked up (a network or virtual
+             filesystem, or a platform without sysfs).
+    """
+
+    dev_dir = os.path.join(SYS_DEV_BLOCK_DIR, str(os.major(device)) + ":" + str(os.minor(device)))
+    if not os.path.exists(dev_dir):
+        return None
+
+    # The flags are kept on the disk, not on its partitions.
+    dev_dir = os.path.realpath(dev_dir)
+    if os.path.exists(os.path.join(dev_dir, "partition")):
+        dev_dir = os.path.dirname(dev_dir)
+
+    if _read_sys_flag(os.path.join(dev_dir, "removable")) or os.path.basename(dev_dir).startswith(CARD_DEVICE_PREFIXES):
+        return "removable"
+
+    if _read_sys_flag(os.path.join(dev_dir, "queue", "rotational")):
+        return "rotational"
+
+    return "ssd"
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def round_robin(iterables):
+    """
+    Generates the items of several iterables, taking one from each in turn until they are all used up.
+
+    :param iterables: A list of iterables.
+
+    :return: A generator of the items.
+    """
+
+    iterators = [iter(iterable) for iterable in iterables]
+    while iterators:
+        remaining = list()
+        for iterator in iterators:
+            try:
+                yield next(iterator)
+            except StopIteration:
+                continue
+            remaining.append(iterator)
+        iterators = remaining
+
+
+class DeviceLanes(object):
+    """
+    A class to run work on files in one lane per physical device, so that work on files that live on different devices
+    happens at the same time instead of one device sitting idle while another is being read.
+
+    Each lane is a pool of worker threads of its own, sized to suit its device: a spinning disk or a memory card is
+    only read one file at a time (more would only make it seek), while an SSD (or a device whose kind cannot be told)
+    gets as many workers as were asked for. Lanes are created as files on new devices are seen.
+    """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self,
+                 jobs=1,
+                 serial_jobs=1,
+                 by_device=True):
+        """
+        Sets up the lanes.
+
+        :param jobs: The number of workers in the lane of an SSD, or of a device whose kind is not known. Defaults to 1.
+        :param serial_jobs: The number of workers in the lane of a spinning disk or a removable device. Never more than
+               jobs. Defaults to 1.
+        :param by_device: If False, all of the work goes through a single lane of jobs workers, whatever device the
+               files are on. Defaults to True.
+        """
+
+        self.by_device = by_device
+        self.jobs = max(jobs, 1)
+        self.serial_jobs = max(min(serial_jobs, self.jobs), 1)
+
+        self.devices = dict()
+        self.executors = dict()
+        self.num_workers = 0
+        self.lock = threading.Lock()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __enter__(self):
+        return self
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __exit__(self,
+                 exc_type,
+                 exc_val,
+                 exc_tb):
+        self.shutdown()
+        return False
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def device_of(self,
+                  file_p):
+        """
+        Returns the device a file lives on. The result is cached per directory.
+
+        :param file_p: The path to the file.
+
+        :return: The device number (st_dev), or None if the file cannot be stat-ed (or the lanes are not split by
+                 device).
+        """
+
+        if not self.by_device:
+            return None
+
+        dir_path = os.path.dirname(os.path.abspath(file_p))
+        try:
+            return self.devices[dir_path]
+        except KeyError:
+            pass
+
+        try:
+            device = os.stat(dir_path).st_dev
+        except OSError:
+            device = None
+
+        self.devices[dir_path] = device
+        return device
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def lane_jobs(self,
+                  device):
+        """
+        Returns the number of workers the lane of a device gets.
+
+        :param device: The device number.
+
+        :return: The number of workers.
+        """
+
+        if device is not None and device_kind(device) in ("rotational", "removable"):
+            return self.serial_jobs
+        return self.jobs
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def submit(self,
+               file_p,
+               fn,
+               *args):
+        """
+        Runs a function in the lane of the device that a file lives on.
+
+        :param file_p: The path to the file the work is for.
+        :param fn: The function to run.
+        :param args: The arguments to pass to the function.
+
+        :return: A future for the result of the function.
+        """
+
+        device = self.device_of(file_p)
+        with self.lock:
+            try:
+                executor = self.executors[device]
+            except KeyError:
+                lane_jobs = self.lane_jobs(device)
+                executor = ThreadPoolExecutor(max_workers=lane_jobs)
+                self.executors[device] = executor
+                self.num_workers += lane_jobs
+
+        return executor.submit(fn, *args)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def interleave(self,
+                   file_paths):
+        """
+        Reorders a list of files so that files on different devices take turns: the first file of each device, then the
+        second file of each device, and so on. Files on the same device stay in the same order.
+
+        :param file_paths: The list of file paths.
+
+        :return: The reordered list.
+        """
+
+        by_device = dict()
+        for file_path in file_paths:
+            by_device.setdefault(self.device_of(file_path), list()).append(file_path)
+
+        return list(round_robin(by_device.values()))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def shutdown(self):
+        """
+        Waits for the work in every lane to finish and stops the workers.
+
+        :return: Nothing.
+        """
+
+        with self.lock:
+            executors = list(self.executors.values())
+            self.executors = dict()
+            self.num_workers = 0
+
+        for executor in executors:
+            executor.shutdown(wait=True)
@@ -0,0 +1,245 @@
+import os
+
+from src import runreport
+from src import verifiedcopy
+from src.lrucache import LRUCache
+
+
+class DigestCache(object):
+    """
+    A class to compare files for the duration of a single run, reading as little of each file as possible. Files are
+    compared by size first, then by a cheap partial checksum (the first and last blocks of the file), and only then by
+    a full checksum. Every size and checksum is memoized per path, so no file is ever hashed twice in a run (unless the
+    caches are given a maximum size, in which case the entries used the longest time ago are dropped).
+
+    Catalog files whose full checksums are already held (and still current) in the checksum index are never read: they
+    skip the partial checksum and are compared by their full checksums straight away.
+    """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self,
+                 checksum_index=None,
+                 partial_block_size=2**16,
+                 hash_algorithm=None,
+                 async_fs=None,
+                 max_entries=None):
+        """
+        Sets up the empty caches.
+
+        :param checksum_index: An optional checksum index object. If given, full checksums of files that live in the
+               catalog are taken from (and added to) the index. Defaults to None.
+        :param partial_block_size: The size of the blocks at the start and end of the file that make up the partial
+               checksum. Defaults to 64KB.
+        :param hash_algorithm: The hash algorithm to use. Defaults to the checksum index's algorithm if there is one,
+               otherwise md5.
+        :param async_fs: An optional async filesystem object. If given, file sizes are taken from its stat cache.
+               Defaults to None.
+        :param max_entries: The most sizes (and partial and full checksums) to keep, so that memory use does not grow
+               with the number of files compared. If None, everything is kept for the rest of the run. Defaults to
+               None.
+        """
+
+        if hash_algorithm is None:
+            hash_algorithm = verifiedcopy.DEFAULT_HASH_ALGORITHM
+            if checksum_index is not None:
+                hash_algorithm = checksum_index.hash_algorithm
+
+        self.checksum_index = checksum_index
+        self.partial_block_size = partial_block_size
+        self.hash_algorithm = hash_algorithm
+        self.async_fs = async_fs
+
+        self.sizes = LRUCache(max_entries)
+        self.partial_digests = LRUCache(max_entries)
+        self.full_digests = LRUCache(max_entries)
+
+        # Keyed on path. The value is the current checksum from the checksum index, or None if it has none.
+        self.indexed_digests = LRUCache(max_entries)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def size(self,
+             file_p):
+        """
+        Returns the size of the file.
+
+        :param file_p: The path to the file.
+
+        :return: The size of the file in bytes.
+        """
+
+        try:
+            return self.sizes[file_p]
+        except KeyError:
+            pass
+
+        if self.async_fs is not None:
+            size = self.async_fs.getsize(file_p)
+        else:
+            size = os.path.getsize(file_p)
+
+        self.sizes[file_p] = size
+        return size
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def indexed_digest(self,
+                       file_p):
+        """
+        Returns the full checksum of the file from the checksum index, if the index holds a current one made with the
+        same algorithm. Never reads the file.
+
+        :param file_p: The path to the file.
+
+        :return: The checksum, or None if the index does not hold one.
+        """
+
+        if self.checksum_index is None or self.checksum_index.hash_algorithm != self.hash_algorithm:
+            return None
+
+        try:
+            return self.indexed_digests[file_p]
+        except KeyError:
+            pass
+
+        stat_result = None
+        if self.async_fs is not None:
+            stat_result = self.async_fs.stat(file_p)
+        digest = self.checksum_index.lookup(file_p, stat_result)
+
+        self.indexed_digests[file_p] = digest
+        if digest is not None:
+            runreport.count("checksum_index_hits")
+            self.full_digests[file_p] = digest
+        return digest
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def partial_digest(self,
+                       file_p):
+        """
+        Returns a checksum of the first and last blocks of the file. Small files are hashed in full instead.
+
+        :param file_p: The path to the file.
+
+        :return: The partial checksum.
+        """
+
+        try:
+            digest = self.partial_digests[file_p]
+            runreport.count("digest_cache_hits")
+            return digest
+        except KeyError:
+            pass
+
+        if self.size(file_p) <= 2 * self.partial_block_size:
+            digest = self.full_digest(file_p)
+        else:
+            digest = verifiedcopy.partial_digest_for_file(file_p, self.hash_algorithm, self.partial_block_size)
+
+        self.partial_digests[file_p] = digest
+        return digest
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def full_digest(self,
+                    file_p):
+        """
+        Returns the checksum of the whole file.
+
+        :param file_p: The path to the file.
+
+        :return: The checksum.
+        """
+
+        try:
+            digest = self.full_digests[file_p]
+            runreport.count("digest_cache_hits")
+            return digest
+        except KeyError:
+            pass
+
+        if self.checksum_index is None or self.checksum_index.hash_algorithm != self.hash_algorithm:
+            digest = verifiedcopy.digest_for_file(file_p, self.hash_algorithm)
+        else:
+            digest = self.checksum_index.digest_for_file(file_p)
+
+        self.full_digests[file_p] = digest
+        return digest
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def known_digest(self,
+                     file_p):
+        """
+        Returns the full checksum of the file if it has already been computed (or looked up) in this run. Never reads
+        the file.
+
+        :param file_p: The path to the file.
+
+        :return: The checksum, or None if it is not known.
+        """
+
+        return self.full_digests.get(file_p)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def files_are_identical(self,
+                            file_a_p,
+                            file_b_p):
+        """
+        Compares two files to see if they are identical. Ignores all metadata when comparing.
+
+        :param file_a_p: The path to the first file we are comparing.
+        :param file_b_p: The path to the second file we are comparing.
+
+        :return: True if the files match, False otherwise.
+        """
+
+        if self.size(file_a_p) != self.size(file_b_p):
+            return False
+
+        # If either checksum is already in the index, comparing partial checksums first would only read more.
+        if self.indexed_digest(file_a_p) is not None or self.indexed_digest(file_b_p) is not None:
+            return self.full_digest(file_a_p) == self.full_digest(file_b_p)
+
+        if self.partial_digest(file_a_p) != self.partial_digest(file_b_p):
+            return False
+
+        return self.full_digest(file_a_p) == self.full_digest(file_b_p)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def find_identical(self,
+                       file_p,
+                       candidates):
+        """
+        Finds a candidate file that is identical to the given file. The candidates are narrowed down by size. Those
+        whose full checksums are in the checksum index are then compared by those. The others are narrowed down by
+        partial checksum, and only the survivors are hashed in full.
+
+        :param file_p: The path to the file.
+        :param candidates: An iterable of paths to compare against.
+
+        :return: The path of an identical candidate, or None if there is none.
+        """
+
+        size = self.size(file_p)
+        candidates = [candidate for candidate in candidates if self.size(candidate) == size]
+        if not candidates:
+            return None
+
+        indexed_candidates = [candidate for candidate in candidates if self.indexed_digest(candidate) is not None]
+        if indexed_candidates:
+            full_digest = self.full_digest(file_p)
+            for candidate in indexed_candidates:
+                if self.full_digest(candidate) == full_digest:
+                    return candidate
+            candidates = [candidate for candidate in candidates if self.indexed_digest(candidate) is None]
+            if not candidates:
+                return None
+
+        partial_digest = self.partial_digest(file_p)
+        candidates = [candidate for candidate in candidates if self.partial_digest(candidate) == partial_digest]
+        if not candidates:
+            return None
+
+        full_digest = self.full_digest(file_p)
+        for candidate in candidates:
+            if self.full_digest(candidate) == full_digest:
+                return candidate
+
+        return None
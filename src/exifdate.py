@@ -0,0 +1,206 @@
+"""
+A small, header-only reader for the EXIF DateTimeOriginal tag.
+
+Rather than parsing every tag in the file (including maker notes and thumbnails), this follows the chain of offsets
+from the start of the file straight to the single tag that is needed, reading only a few small chunks of the header.
+It understands TIFF based files (TIF, CR2, NEF, DNG, ARW, etc.) and JPEG files with an APP1 Exif segment. Anything it
+does not understand results in None so that the caller can fall back to a full exif parser.
+"""
+
+import struct
+
+EXIF_IFD_POINTER_TAG = 0x8769
+DATE_TIME_ORIGINAL_TAG = 0x9003
+ASCII_TYPE = 2
+
+# JPEG markers
+SOI = 0xD8
+SOS = 0xDA
+EOI = 0xD9
+APP1 = 0xE1
+
+# How far into a JPEG file to look for the Exif segment before giving up.
+MAX_JPEG_SCAN_BYTES = 2**18
+
+# Sanity limit on the number of entries in a single IFD. Anything larger means we are not looking at a real IFD.
+MAX_IFD_ENTRIES = 1000
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _read_exact(image_file,
+                offset,
+                length):
+    """
+    Reads exactly length bytes from the file at the given offset.
+
+    :param image_file: A binary file object opened for reading.
+    :param offset: The absolute offset in the file to read from.
+    :param length: The number of bytes to read.
+
+    :return: The bytes read, or None if the file is too short.
+    """
+
+    image_file.seek(offset)
+    data = image_file.read(length)
+    if len(data) != length:
+        return None
+
+    return data
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _find_ifd_entry(image_file,
+                    tiff_offset,
+                    ifd_offset,
+                    byte_order,
+                    tag):
+    """
+    Finds the given tag in the IFD that starts at ifd_offset (relative to the TIFF header).
+
+    :param image_file: A binary file object opened for reading.
+    :param tiff_offset: The absolute offset of the TIFF header in the file.
+    :param ifd_offset: The offset of the IFD, relative to the TIFF header.
+    :param byte_order: Either "<" (Intel) or ">" (Motorola).
+    :param tag: The numerical tag to look for.
+
+    :return: A tuple of (field type, count, raw 4 byte value field), or None if the tag is not in this IFD.
+    """
+
+    data = _read_exact(image_file, tiff_offset + ifd_offset, 2)
+    if data is None:
+        return None
+
+    entry_count = struct.unpack(byte_order + "H", data)[0]
+    if entry_count > MAX_IFD_ENTRIES:
+        return None
+
+    entries = _read_exact(image_file, tiff_offset + ifd_offset + 2, entry_count * 12)
+    if entries is None:
+        return None
+
+    for i in range(entry_count):
+        entry_tag, field_type, count = struct.unpack(byte_order + "HHI", entries[i * 12:i * 12 + 8])
+        if entry_tag == tag:
+            return field_type, count, entries[i * 12 + 8:i * 12 + 12]
+
+    return None
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _read_tiff_date(image_file,
+                    tiff_offset):
+    """
+    Reads the DateTimeOriginal tag from a TIFF structure that starts at tiff_offset.
+
+    :param image_file: A binary file object opened for reading.
+    :param tiff_offset: The absolute offset of the TIFF header in the file.
+
+    :return: The date string (e.g. "2020:01:31 12:00:00"), or None if it could not be found.
+    """
+
+    header = _read_exact(image_file, tiff_offset, 8)
+    if header is None:
+        return None
+
+    if header[:2] == b"II":
+        byte_order = "<"
+    elif header[:2] == b"MM":
+        byte_order = ">"
+    else:
+        return None
+
+    magic, ifd0_offset = struct.unpack(byte_order + "HI", header[2:8])
+    if magic != 42:
+        return None
+
+    entry = _find_ifd_entry(image_file, tiff_offset, ifd0_offset, byte_order, EXIF_IFD_POINTER_TAG)
+    if entry is None:
+        return None
+    exif_ifd_offset = struct.unpack(byte_order + "I", entry[2])[0]
+
+    entry = _find_ifd_entry(image_file, tiff_offset, exif_ifd_offset, byte_order, DATE_TIME_ORIGINAL_TAG)
+    if entry is None:
+        return None
+
+    field_type, count, value = entry
+    if field_type != ASCII_TYPE or count == 0:
+        return None
+
+    if count <= 4:
+        data = value[:count]
+    else:
+        data = _read_exact(image_file, tiff_offset + struct.unpack(byte_order + "I", value)[0], count)
+        if data is None:
+            return None
+
+    date_str = data.split(b"\x00")[0].decode("ascii", errors="replace").strip()
+    if not date_str:
+        return None
+
+    return date_str
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _find_jpeg_exif(image_file):
+    """
+    Walks the markers at the start of a JPEG file looking for the APP1 Exif segment.
+
+    :param image_file: A binary file object opened for reading.
+
+    :return: The absolute offset of the TIFF header inside the Exif segment, or None if there is no Exif segment.
+    """
+
+    offset = 2
+    while offset < MAX_JPEG_SCAN_BYTES:
+
+        data = _read_exact(image_file, offset, 4)
+        if data is None or data[0] != 0xFF:
+            return None
+
+        marker = data[1]
+        if marker == 0xFF:
+            # Fill byte
+            offset += 1
+            continue
+
+        if marker in (SOS, EOI):
+            return None
+
+        length = struct.unpack(">H", data[2:4])[0]
+        if marker == APP1:
+            if _read_exact(image_file, offset + 4, 6) == b"Exif\x00\x00":
+                return offset + 10
+
+        offset += 2 + length
+
+    return None
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def read_date_time_original(image_file):
+    """
+    Reads the EXIF DateTimeOriginal tag from an open image file using only the file's header.
+
+    :param image_file: A binary file object opened for reading. It must be seekable.
+
+    :return: The date string (e.g. "2020:01:31 12:00:00"), or None if it could not be found.
+    """
+
+    try:
+        start = _read_exact(image_file, 0, 4)
+        if start is None:
+            return None
+
+        if start[0] == 0xFF and start[1] == SOI:
+            tiff_offset = _find_jpeg_exif(image_file)
+            if tiff_offset is None:
+                return None
+            return _read_tiff_date(image_file, tiff_offset)
+
+        if start[:2] in (b"II", b"MM"):
+            return _read_tiff_date(image_file, 0)
+
+    except (struct.error, OSError, ValueError):
+        return None
+
+    return None
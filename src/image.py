@@ -1,4 +1,5 @@
 import os
+import sys
 import time
 
 try:
@@ -6,52 +7,44 @@ try:
 except ImportError:
     exifread = None
 
+from src import exifdate
+from src import runreport
+from src import verifiedcopy
 
-# ======================================================================================================================
-# import verifiedcopy
 
-
-
-class Image(object):
+class ImageConfig(object):
     """
-    A class to process and contain the metadata for an image
+    A class to hold the settings that are shared by every image of an import, so that each image object only has to
+    keep a reference to them. It also holds a table of the source directories: every image in a directory refers to the
+    same directory string, and only keeps the name of its file.
     """
 
     # ------------------------------------------------------------------------------------------------------------------
     def __init__(self,
-                 source_path,
                  catalog_path,
                  do_rename,
                  notify_obj,
-                 count_str="",
                  include_sidecar=True,
-                 sidecar_extensions=None):
+                 sidecar_extensions=None,
+                 sidecar_resolver=None):
         """
-        Store some initial data for this image
+        Store the shared settings.
 
-        :param source_path: The full path on disk where this image lives.
         :param catalog_path: The full path where the image catalog lives.
         :param do_rename: A boolean that controls whether to rename the files on copy or not.
         :param notify_obj: A notification object.
-        :param count_str: A string that displays the current count while reading exif data. Example: (1 of 10). Defaults
-               to "".
         :param include_sidecar: If true, then a sidecar file will also be included if it exists. Defaults to True.
         :param sidecar_extensions: A list of possible file extensions for sidecar files. Defaults to ["xmp"].
+        :param sidecar_resolver: An optional sidecar resolver object that finds sidecars from a single listing of each
+               directory instead of probing the disk for each possible sidecar name. If given, it is used instead of
+               sidecar_extensions. Defaults to None.
         """
 
-        self.source_path = source_path
         self.catalog_path = catalog_path
-        self.notify_obj = notify_obj
         self.do_rename = do_rename
-        self.count_str = count_str
-
-        # self.base_name, self.ext = os.path.splitext(os.path.split(source_path)[1])
-        self.year = None
-        self.month = None
-        self.day = None
-        self.dest_path = None
-        self.sidecar_path = None
-        self.sidecar_dest_path = None
+        self.notify_obj = notify_obj
+        self.include_sidecar = include_sidecar
+        self.sidecar_resolver = sidecar_resolver
 
         if sidecar_extensions is None:
             self.sidecar_extensions = ["xmp"]
@@ -60,37 +53,243 @@ class Image(object):
             for sidecar_extension in sidecar_extensions:
                 self.sidecar_extensions.append(sidecar_extension.lstrip("."))
 
+        self.directories = dict()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def shared_dir(self,
+                   dir_path):
+        """
+        Returns the one copy of a directory path that is shared by every image in that directory.
+
+        :param dir_path: The path to the directory.
+
+        :return: The shared string.
+        """
+
+        return self.directories.setdefault(dir_path, dir_path)
+
+
+class Image(object):
+    """
+    A class to process and contain the metadata for an image.
+
+    An import may hold a million of these at once, so an image only stores what is particular to it: its directory (a
+    string shared with every other image in that directory), its file name, its date and the results of its copy. The
+    settings it shares with the other images live in an ImageConfig object, and its full paths (source, sidecar and
+    destinations) are built from those parts when they are asked for.
+    """
+
+    __slots__ = ("config",
+                 "source_dir",
+                 "source_name",
+                 "sidecar_name",
+                 "year",
+                 "month",
+                 "day",
+                 "digest",
+                 "sidecar_digest",
+                 "copy_backend",
+                 "sidecar_copy_backend")
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self,
+                 source_path,
+                 config,
+                 count_str=""):
+        """
+        Store some initial data for this image
+
+        :param source_path: The full path on disk where this image lives.
+        :param config: The image config object shared by all of the images being imported.
+        :param count_str: A string that displays the current count while reading exif data. Example: (1 of 10). Defaults
+               to "".
+        """
+
+        self.config = config
+
+        source_dir, self.source_name = os.path.split(source_path)
+        self.source_dir = config.shared_dir(source_dir)
+
+        self.sidecar_name = None
+        self.year = None
+        self.month = None
+        self.day = None
+        self.digest = None
+        self.sidecar_digest = None
+        self.copy_backend = None
+        self.sidecar_copy_backend = None
+
         # Extract the image date
-        self.process_image()
+        self.process_image(count_str)
 
         # Find a sidecar image if it exists
-        if include_sidecar:
+        if config.include_sidecar:
             self.find_sidecar()
 
-        # Build a destination path
-        self.build_image_destination()
+    # ------------------------------------------------------------------------------------------------------------------
+    @classmethod
+    def from_plan(cls,
+                  entry,
+                  config):
+        """
+        Creates an image object from an entry of an import plan (see importplan.py) without reading anything from disk.
+        The date and sidecar are taken from the plan as they are.
+
+        :param entry: The plan entry (a dictionary).
+        :param config: The image config object. It must have the same rename setting as the import that wrote the plan.
+
+        :return: The image object.
+        """
+
+        image_obj = cls.__new__(cls)
+
+        image_obj.config = config
+
+        source_dir, image_obj.source_name = os.path.split(entry["source"])
+        image_obj.source_dir = config.shared_dir(source_dir)
+
+        image_obj.sidecar_name = None
+        if entry["sidecar"] is not None:
+            image_obj.sidecar_name = os.path.split(entry["sidecar"])[1]
+
+        image_obj.set_date(*entry["date"].split("-"))
+
+        image_obj.digest = None
+        image_obj.sidecar_digest = None
+        image_obj.copy_backend = None
+        image_obj.sidecar_copy_backend = None
+
+        if os.path.abspath(image_obj.dest_path) != os.path.abspath(entry["dest"]):
+            raise ValueError("The plan entry does not match its destination: " + entry["dest"])
+
+        return image_obj
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @property
+    def source_path(self):
+        """
+        :return: The full path on disk where this image lives.
+        """
+
+        return os.path.join(self.source_dir, self.source_name)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @property
+    def sidecar_path(self):
+        """
+        :return: The full path on disk of the image's sidecar file, or None if it does not have one.
+        """
 
-        # Build a sidecar destination path
-        if include_sidecar:
-            self.build_sidecar_destination()
+        if self.sidecar_name is None:
+            return None
+        return os.path.join(self.source_dir, self.sidecar_name)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @property
+    def catalog_path(self):
+        """
+        :return: The full path where the image catalog lives.
+        """
+
+        return self.config.catalog_path
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @property
+    def notify_obj(self):
+        """
+        :return: The notification object.
+        """
+
+        return self.config.notify_obj
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @property
+    def dest_path(self):
+        """
+        :return: The path to the destination file.
+        """
+
+        date_str = self.build_image_date()
+        if self.config.do_rename:
+            dest_file_name = date_str + "-" + self.source_name
+        else:
+            dest_file_name = self.source_name
+        return os.path.join(self.build_dest_dir_path(date_str), dest_file_name)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @property
+    def sidecar_dest_path(self):
+        """
+        :return: The path to the sidecar's destination file, or None if the image does not have a sidecar.
+        """
+
+        if self.sidecar_name is None:
+            return None
+        date_str = self.build_image_date()
+        return os.path.join(self.build_dest_dir_path(date_str), date_str + "-" + self.sidecar_name)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def set_date(self,
+                 year,
+                 month,
+                 day):
+        """
+        Sets the date of the image. The strings are interned, so that every image taken on the same day shares them.
+
+        :param year: The year as a string.
+        :param month: The month as a string.
+        :param day: The day as a string.
+
+        :return: Nothing.
+        """
+
+        self.year = sys.intern(year)
+        self.month = sys.intern(month)
+        self.day = sys.intern(day)
 
     # ------------------------------------------------------------------------------------------------------------------
     def __read_image_exif(self,
-                          exif_tag):
+                          exif_tag,
+                          count_str=""):
         """
         Reads in the specified exif tag from from the image given by image path.
 
+        The DateTimeOriginal tag is first looked for by a header-only reader that touches just a few KB of the file. If
+        that fails (or for any other tag) the file is parsed by exifread, skipping maker notes and thumbnails and
+        stopping as soon as the tag has been found.
+
         :param exif_tag: The name of the tag we want to extract
+        :param count_str: A string that displays the current count. Example: (1 of 10). Defaults to "".
 
         :return: A string containing the exif data.
         """
 
-        assert os.path.exists(self.source_path)
-        assert not os.path.isdir(self.source_path)
+        source_path = self.source_path
+
+        assert os.path.exists(source_path)
+        assert not os.path.isdir(source_path)
+
+        with open(source_path, 'rb') as image_file:
+            if count_str:
+                self.config.notify_obj.notify("%s Reading EXIF data: %s", count_str, source_path)
+            else:
+                self.config.notify_obj.notify("Reading EXIF data: %s", source_path)
 
-        with open(self.source_path, 'rb') as image_file:
-            self.notify_obj.notify((self.count_str + " Reading EXIF data: " + self.source_path).lstrip(" "))
-            tags = exifread.process_file(image_file)
+            if exif_tag == "EXIF DateTimeOriginal":
+                value = exifdate.read_date_time_original(image_file)
+                if value is not None:
+                    runreport.count("exif_header_reads")
+                    return value
+                image_file.seek(0)
+
+            if exifread is None:
+                return None
+
+            runreport.count("exif_full_parses")
+            tags = exifread.process_file(image_file,
+                                         stop_tag=exif_tag.split(" ")[-1],
+                                         details=False,
+                                         extract_thumbnail=False)
 
             if exif_tag not in tags.keys():
                 return None
@@ -98,24 +297,30 @@ class Image(object):
             return str(tags[exif_tag])
 
     # ------------------------------------------------------------------------------------------------------------------
-    def process_image(self):
+    def process_image(self,
+                      count_str=""):
         """
         Extracts the date from the image exif data. If there is no exif data, extracts the file creation date instead.
 
+        :param count_str: A string that displays the current count while reading exif data. Example: (1 of 10). Defaults
+               to "".
+
         :return: Nothing.
         """
 
-        assert os.path.exists(self.source_path)
-        assert not os.path.isdir(self.source_path)
+        source_path = self.source_path
 
-        image_date = self.__read_image_exif("EXIF DateTimeOriginal")
+        assert os.path.exists(source_path)
+        assert not os.path.isdir(source_path)
+
+        image_date = self.__read_image_exif("EXIF DateTimeOriginal", count_str)
         if image_date is not None:
             image_date = image_date.split(" ")[0]
-            self.year, self.month, self.day = image_date.split(":")
+            self.set_date(*image_date.split(":"))
         else:
-            self.year = time.strftime("%Y", time.localtime(os.path.getmtime(self.source_path)))
-            self.month = time.strftime("%m", time.localtime(os.path.getmtime(self.source_path)))
-            self.day = time.strftime("%d", time.localtime(os.path.getmtime(self.source_path)))
+            runreport.count("exif_mtime_fallbacks")
+            mtime = time.localtime(os.path.getmtime(source_path))
+            self.set_date(time.strftime("%Y", mtime), time.strftime("%m", mtime), time.strftime("%d", mtime))
 
     # ------------------------------------------------------------------------------------------------------------------
     def find_sidecar(self):
@@ -128,30 +333,29 @@ class Image(object):
 
         So, for example, it will look for IMG_0001.xmp AND IMG_0001.cr2.xmp.
 
+        If this image has a sidecar resolver, the lookup is done against its directory listing instead of the disk.
+
         :return: Nothing.
         """
 
-        for ext in self.sidecar_extensions:
-
-            # Look for cases where the sidecar image extension replaces the image file extension (upper and lower case)
-            potential_sidecar_path = os.path.splitext(self.source_path)[0] + "." + ext.lstrip(".").lower()
-            if os.path.exists(potential_sidecar_path):
-                self.sidecar_path = potential_sidecar_path
-                return
-            potential_sidecar_path = os.path.splitext(self.source_path)[0] + "." + ext.lstrip(".").upper()
-            if os.path.exists(potential_sidecar_path):
-                self.sidecar_path = potential_sidecar_path
-                return
-
-            # Look for cases where the sidecar extension is added to the image file extension (upper and lower case)
-            potential_sidecar_path = self.source_path + "." + ext.lstrip(".").lower()
-            if os.path.exists(potential_sidecar_path):
-                self.sidecar_path = potential_sidecar_path
-                return
-            potential_sidecar_path = self.source_path + "." + ext.lstrip(".").upper()
-            if os.path.exists(potential_sidecar_path):
-                self.sidecar_path = potential_sidecar_path
-                return
+        if self.config.sidecar_resolver is not None:
+            sidecar_path = self.config.sidecar_resolver.find_sidecar(self.source_path)
+            if sidecar_path is not None:
+                self.sidecar_name = os.path.split(sidecar_path)[1]
+            return
+
+        stem = os.path.splitext(self.source_name)[0]
+        for ext in self.config.sidecar_extensions:
+
+            # Look for cases where the sidecar image extension replaces the image file extension (upper and lower case),
+            # then for cases where the sidecar extension is added to the image file extension (upper and lower case)
+            for potential_sidecar_name in (stem + "." + ext.lstrip(".").lower(),
+                                           stem + "." + ext.lstrip(".").upper(),
+                                           self.source_name + "." + ext.lstrip(".").lower(),
+                                           self.source_name + "." + ext.lstrip(".").upper()):
+                if os.path.exists(os.path.join(self.source_dir, potential_sidecar_name)):
+                    self.sidecar_name = potential_sidecar_name
+                    return
 
     # ------------------------------------------------------------------------------------------------------------------
     def build_image_date(self):
@@ -174,46 +378,27 @@ class Image(object):
         :return: A string containing the full path to the destination directory.
         """
 
-        return os.path.join(self.catalog_path, self.year, date_str)
-
-    # ------------------------------------------------------------------------------------------------------------------
-    def build_image_destination(self):
-        """
-        Builds a path to the destination file.
-
-        :return: Nothing.
-        """
-
-        date_str = self.build_image_date()
-        full_dest_dir = self.build_dest_dir_path(date_str)
-        if self.do_rename:
-            dest_file_name = date_str + "-" + os.path.split(self.source_path)[1]
-        else:
-            dest_file_name = os.path.split(self.source_path)[1]
-        self.dest_path = os.path.join(full_dest_dir, dest_file_name)
-
-    # ------------------------------------------------------------------------------------------------------------------
-    def build_sidecar_destination(self):
-        """
-        Builds a path to the sidecar's destination file.
-
-        :return: Nothing.
-        """
-
-        if self.sidecar_path:
-            date_str = self.build_image_date()
-            full_dest_dir = self.build_dest_dir_path(date_str)
-            dest_file_name = date_str + "-" + os.path.split(self.sidecar_path)[1]
-            self.sidecar_dest_path = os.path.join(full_dest_dir, dest_file_name)
+        return os.path.join(self.config.catalog_path, self.year, date_str)
 
     # ------------------------------------------------------------------------------------------------------------------
     def copy_to_dest(self,
-                     trial=False):
+                     trial=False,
+                     checksum_index=None,
+                     copy_mode="python",
+                     make_dirs=True):
         """
-        Does a verified copy of the source file to the destination.
+        Does a verified copy of the source file to the destination. The checksums of the copied files are kept in
+        self.digest and self.sidecar_digest, and the names of the copy backends that were used in self.copy_backend and
+        self.sidecar_copy_backend. A file whose checksum is already known has already been copied (by an earlier attempt
+        that failed on the other file of the pair) and is not copied again.
 
         :param trial: If True, then the copy string will be printed, but no actual copy will be made. For debugging.
                Defaults to False.
+        :param checksum_index: An optional checksum index object where the checksums of the copied files will be
+               recorded. Defaults to None.
+        :param copy_mode: The copy backend to use. See verifiedcopy.copy_file for the list of options. Defaults to
+               "python".
+        :param make_dirs: If True, the destination directory is created if it does not exist. Defaults to True.
 
         :return: Nothing.
         """
@@ -222,17 +407,27 @@ class Image(object):
         if trial:
             copy_str = "Trial copy: "
 
-        if not trial:
-            os.makedirs(os.path.split(self.dest_path)[0], exist_ok=True)
-
-        msg = copy_str + self.source_path + " -> " + self.dest_path
-        self.notify_obj.notify(msg=msg)
-        if not trial:
-            verifiedcopy.verified_copy_file(self.source_path, self.dest_path)
-
-        if self.sidecar_path:
-            msg = copy_str + self.sidecar_path + " -> " + self.sidecar_dest_path
-            self.notify_obj.notify(msg=msg)
-            if not trial:
-                verifiedcopy.verified_copy_file(self.sidecar_path, self.sidecar_dest_path)
-            self.notify_obj.notify("")
+        source_path = self.source_path
+        dest_path = self.dest_path
+
+        if not trial and make_dirs:
+            os.makedirs(os.path.split(dest_path)[0], exist_ok=True)
+
+        self.config.notify_obj.notify("%s%s -> %s", copy_str, source_path, dest_path)
+        if not trial and self.digest is None:
+            self.digest, self.copy_backend = verifiedcopy.verified_copy_file(source_path,
+                                                                             dest_path,
+                                                                             checksum_index,
+                                                                             copy_mode)
+
+        if self.sidecar_name is not None:
+            sidecar_path = self.sidecar_path
+            sidecar_dest_path = self.sidecar_dest_path
+            self.config.notify_obj.notify("%s%s -> %s", copy_str, sidecar_path, sidecar_dest_path)
+            if not trial and self.sidecar_digest is None:
+                self.sidecar_digest, self.sidecar_copy_backend = verifiedcopy.verified_copy_file(
+                    sidecar_path,
+                    sidecar_dest_path,
+                    checksum_index,
+                    copy_mode)
+            self.config.notify_obj.notify("")
@@ -0,0 +1,225 @@
+import gzip
+import json
+import os
+import time
+
+from src.collisions import Collisions
+
+PLAN_VERSION = 3
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _open_plan(plan_path,
+               mode):
+    """
+    Opens a plan file for reading or writing text. Plans whose name ends in ".gz" are gzip compressed.
+
+    :param plan_path: The path to the plan file.
+    :param mode: Either "r" or "w".
+
+    :return: A file object.
+    """
+
+    if plan_path.endswith(".gz"):
+        return gzip.open(plan_path, mode + "t", encoding="utf-8")
+
+    return open(plan_path, mode, encoding="utf-8")
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _stat_matches(file_p,
+                  size,
+                  mtime_ns):
+    """
+    Checks that a file still exists with the given size and modification time.
+
+    :param file_p: The path to the file.
+    :param size: The expected size.
+    :param mtime_ns: The expected modification time in nanoseconds.
+
+    :return: True if the file exists and matches, False otherwise.
+    """
+
+    try:
+        stat_result = os.stat(file_p)
+    except OSError:
+        return False
+
+    return stat_result.st_size == size and stat_result.st_mtime_ns == mtime_ns
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def entry_is_current(entry):
+    """
+    Checks that nothing has changed since a plan entry was written: the source file (and its sidecar) still have the
+    same size and modification time, and nothing has been put at the destination since. Only stat calls are made.
+
+    :param entry: The plan entry (a dictionary).
+
+    :return: True if the entry can still be copied as planned, False otherwise.
+    """
+
+    if not _stat_matches(entry["source"], entry["size"], entry["mtime_ns"]):
+        return False
+
+    if os.path.exists(entry["dest"]):
+        return False
+
+    if entry["sidecar"] is not None:
+        if not _stat_matches(entry["sidecar"], entry["sidecar_size"], entry["sidecar_mtime_ns"]):
+            return False
+        if os.path.exists(entry["sidecar_dest"]):
+            return False
+
+    return True
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def read_plan(plan_path):
+    """
+    Reads a plan file written by PlanWriter.
+
+    :param plan_path: The path to the plan file.
+
+    :return: A tuple of (the header dictionary, the list of entries, a collisions object holding the collisions that were
+             found when the plan was made).
+    """
+
+    header = None
+    entries = list()
+    collisions_obj = Collisions()
+
+    with _open_plan(plan_path, "r") as f:
+        for line in f:
+            record = json.loads(line)
+            if record["type"] == "header":
+                header = record
+            elif record["type"] == "image":
+                entries.append(record)
+            elif record["type"] == "collisions":
+                for name, items in record["lists"].items():
+                    if hasattr(collisions_obj, name):
+                        setattr(collisions_obj, name, [tuple(item) if type(item) is list else item for item in items])
+
+    if header is None or header.get("version") != PLAN_VERSION:
+        raise ValueError("Not a valid import plan (or one written by a different version): " + plan_path)
+
+    return header, entries, collisions_obj
+
+
+class PlanWriter(object):
+    """
+    A class to write an import plan: everything that was worked out about an import (the destination of every image and
+    its sidecar, their sizes, modification times, dates and any checksums that are already known, plus the collisions
+    that were found) so that the copy can be run later without scanning the files, reading their exif data or checking
+    for collisions again.
+
+    A plan is a file of JSON lines: a header, one line per image to copy, and a final line listing the collisions. Every
+    path in the plan is absolute, so that the plan can be executed from any directory.
+    """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self,
+                 plan_path,
+                 catalog_path,
+                 do_rename,
+                 hash_algorithm):
+        """
+        Opens the plan file and writes the header.
+
+        :param plan_path: The path to the plan file. If it ends in ".gz", the plan is gzip compressed.
+        :param catalog_path: The full path where the image catalog lives.
+        :param do_rename: Whether the files are renamed as they are imported. The destinations of the images are built
+               from this setting again when the plan is executed.
+        :param hash_algorithm: The hash algorithm of any checksums in the plan.
+        """
+
+        self.num_images = 0
+        self.plan_file = _open_plan(plan_path, "w")
+        self._write({"type": "header",
+                     "version": PLAN_VERSION,
+                     "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                     "catalog": os.path.abspath(catalog_path),
+                     "rename": do_rename,
+                     "algorithm": hash_algorithm})
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _write(self,
+               record):
+        """
+        Writes a single record to the plan.
+
+        :param record: The dictionary to write.
+
+        :return: Nothing.
+        """
+
+        self.plan_file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def add(self,
+            image_obj,
+            digest_cache=None):
+        """
+        Adds an image (and its sidecar, if any) to the plan.
+
+        :param image_obj: The image object.
+        :param digest_cache: An optional digest cache object. Any full checksums it already holds for the image and its
+               sidecar are added to the plan. Defaults to None.
+
+        :return: Nothing.
+        """
+
+        stat_result = os.stat(image_obj.source_path)
+
+        record = {"type": "image",
+                  "source": os.path.abspath(image_obj.source_path),
+                  "size": stat_result.st_size,
+                  "mtime_ns": stat_result.st_mtime_ns,
+                  "date": image_obj.build_image_date(),
+                  "dest": os.path.abspath(image_obj.dest_path),
+                  "digest": None,
+                  "sidecar": None}
+
+        if digest_cache is not None:
+            digest = digest_cache.known_digest(image_obj.source_path)
+            if digest is not None:
+                record["digest"] = digest.hex()
+
+        if image_obj.sidecar_path:
+            sidecar_stat_result = os.stat(image_obj.sidecar_path)
+            record["sidecar"] = os.path.abspath(image_obj.sidecar_path)
+            record["sidecar_size"] = sidecar_stat_result.st_size
+            record["sidecar_mtime_ns"] = sidecar_stat_result.st_mtime_ns
+            record["sidecar_dest"] = os.path.abspath(image_obj.sidecar_dest_path)
+            record["sidecar_digest"] = None
+            if digest_cache is not None:
+                digest = digest_cache.known_digest(image_obj.sidecar_path)
+                if digest is not None:
+                    record["sidecar_digest"] = digest.hex()
+
+        self._write(record)
+        self.num_images += 1
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def close(self,
+              collisions_obj):
+        """
+        Writes the collisions and closes the plan.
+
+        :param collisions_obj: The collisions object.
+
+        :return: Nothing.
+        """
+
+        lists = dict()
+        for name, items in vars(collisions_obj).items():
+            lists[name] = list()
+            for item in items:
+                if type(item) is tuple:
+                    lists[name].append([os.path.abspath(path) for path in item])
+                else:
+                    lists[name].append(os.path.abspath(item))
+
+        self._write({"type": "collisions", "lists": lists})
+        self.plan_file.close()
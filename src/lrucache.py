@@ -0,0 +1,90 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    A dictionary-like cache that holds at most a fixed number of entries. Once it is full, storing a new entry evicts
+    the one that was used the longest time ago. Without a maximum it behaves like a plain dictionary.
+
+    The cache may be shared between threads.
+    """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self,
+                 max_entries=None):
+        """
+        Sets up an empty cache.
+
+        :param max_entries: The most entries the cache holds. If None, the cache is never trimmed. Defaults to None.
+        """
+
+        self.max_entries = max_entries
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __getitem__(self,
+                    key):
+        with self.lock:
+            value = self.entries[key]
+            if self.max_entries is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __setitem__(self,
+                    key,
+                    value):
+        with self.lock:
+            self.entries[key] = value
+            if self.max_entries is not None:
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __contains__(self,
+                     key):
+        with self.lock:
+            return key in self.entries
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def get(self,
+            key,
+            default=None):
+        """
+        Returns the entry for a key, or default if there is none.
+
+        :param key: The key.
+        :param default: What to return if there is no entry for the key. Defaults to None.
+
+        :return: The entry, or default.
+        """
+
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def pop(self,
+            key,
+            default=None):
+        """
+        Removes the entry for a key and returns it, or default if there is none.
+
+        :param key: The key.
+        :param default: What to return if there is no entry for the key. Defaults to None.
+
+        :return: The entry, or default.
+        """
+
+        with self.lock:
+            return self.entries.pop(key, default)
@@ -1,37 +1,107 @@
+import json
+import shutil
+import sys
+import threading
+import time
+
+
 class Notify(object):
 
     # ------------------------------------------------------------------------------------------------------------------
     def __init__(self,
                  notify_type,
-                 active=True):
+                 active=True,
+                 progress_interval=0.5,
+                 json_path=None):
         """
         Sets up the default notification type.
 
-        :param notify_type: From a list (currently: [stdout])
+        "stdout" prints every message as it is sent. "progress" does not print the messages about individual files.
+        Instead, the progress events of each stage are aggregated and a single status line (files, throughput and ETA)
+        is redrawn at a fixed rate. Summary messages are printed in both modes.
+
+        :param notify_type: From a list (currently: [stdout, progress])
         :param active: Whether to actually perform the notification or not. Defaults to True.
+        :param progress_interval: The minimum number of seconds between two redraws of the progress line (and between
+               two JSON lines). Defaults to 0.5.
+        :param json_path: An optional path to a file where the progress is written as JSON lines, at the same rate as
+               the progress line is redrawn. This is done even if active is False. Defaults to None.
         """
 
         self.notify_type = notify_type
         self.active = active
 
-        self.notify_types = ["stdout"]
+        self.notify_types = ["stdout", "progress"]
+
+        # Images may be processed by several threads at once. Serialize the output so that lines do not interleave.
+        self.lock = threading.Lock()
 
         assert notify_type in self.notify_types
 
+        # Only format and print individual messages if they are actually going to be shown.
+        self.messages_enabled = self.active and self.notify_type == "stdout"
+
+        self.progress_interval = progress_interval
+        self.last_draw = 0.0
+        self.line_drawn = False
+        self.stages = dict()
+        self.current_stages = list()
+
+        self.json_file = None
+        if json_path is not None:
+            self.json_file = open(json_path, "a")
+
     # ------------------------------------------------------------------------------------------------------------------
     def notify(self,
-               msg):
+               msg,
+               *args,
+               summary=False):
         """
         Entry point for the notification.
 
-        :param msg: The message we want to send to the user.
+        :param msg: The message we want to send to the user. If args are given, this is a %-style format string, and it
+               is only formatted if the message is actually going to be shown.
+        :param args: Optional arguments for the format string.
+        :param summary: If True, the message is a one-off summary (as opposed to a message about an individual file)
+               and is also shown in progress mode. Defaults to False.
 
         :return: Nothing.
         """
 
+        if summary and self.active and self.notify_type == "progress":
+            if args:
+                msg = msg % args
+            self.notify_progress(msg)
+            return
+
+        if not self.messages_enabled:
+            return
+
+        if args:
+            msg = msg % args
+
         if self.notify_type == "stdout":
             self.notify_stdout(msg)
 
+    # ------------------------------------------------------------------------------------------------------------------
+    def notify_progress(self,
+                        msg):
+        """
+        Prints a message in progress mode. The progress line is cleared first, and is drawn again below the message on
+        the next redraw.
+
+        :param msg: The message to print.
+
+        :return: Nothing.
+        """
+
+        with self.lock:
+            if self.line_drawn:
+                width = shutil.get_terminal_size().columns - 1
+                sys.stdout.write("\r" + " " * width + "\r")
+                self.line_drawn = False
+            print(msg)
+
     # ------------------------------------------------------------------------------------------------------------------
     def notify_stdout(self,
                       msg):
@@ -43,4 +113,166 @@ class Notify(object):
         """
 
         if self.active:
-            print(msg)
+            with self.lock:
+                print(msg)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def set_total(self,
+                  stage,
+                  total_files):
+        """
+        Sets the total number of files a stage is going to process, so that an ETA can be shown.
+
+        :param stage: The name of the stage.
+        :param total_files: The total number of files, or None if it is not known.
+
+        :return: Nothing.
+        """
+
+        with self.lock:
+            self._stage(stage)["total_files"] = total_files
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def progress(self,
+                 stage,
+                 num_files=1,
+                 num_bytes=0):
+        """
+        Records that a stage has processed some more files. In progress mode, the progress line is redrawn if enough
+        time has passed since the last redraw.
+
+        The progress line shows every stage that has reported progress since the last call to end_stage, so stages
+        that run at the same time (as in the streaming pipeline) share one line.
+
+        :param stage: The name of the stage.
+        :param num_files: The number of files processed. Defaults to 1.
+        :param num_bytes: The number of bytes processed. Defaults to 0.
+
+        :return: Nothing.
+        """
+
+        with self.lock:
+            stage_progress = self._stage(stage)
+            stage_progress["files"] += num_files
+            stage_progress["bytes"] += num_bytes
+            if stage not in self.current_stages:
+                self.current_stages.append(stage)
+
+            now = time.monotonic()
+            if now - self.last_draw >= self.progress_interval:
+                self.last_draw = now
+                self._draw(now)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def end_stage(self):
+        """
+        Draws the final state of the current stages and ends the progress line, so that anything printed afterwards
+        starts on a fresh line.
+
+        :return: Nothing.
+        """
+
+        with self.lock:
+            self._end_stage()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def finish(self):
+        """
+        Draws the final state of the progress line and closes the JSON file, if any.
+
+        :return: Nothing.
+        """
+
+        with self.lock:
+            self._end_stage()
+            if self.json_file is not None:
+                self.json_file.close()
+                self.json_file = None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _stage(self,
+               stage):
+        """
+        Returns the progress record for a stage, creating it if needed. Must be called with the lock held.
+
+        :param stage: The name of the stage.
+
+        :return: A dictionary.
+        """
+
+        try:
+            return self.stages[stage]
+        except KeyError:
+            self.stages[stage] = {"files": 0, "bytes": 0, "total_files": None, "start": time.monotonic()}
+            return self.stages[stage]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _end_stage(self):
+        """
+        Draws the final state of the current stages and ends the progress line. Must be called with the lock held.
+
+        :return: Nothing.
+        """
+
+        if self.current_stages:
+            self._draw(time.monotonic())
+            self.current_stages = list()
+        if self.line_drawn:
+            sys.stdout.write("\n")
+            sys.stdout.flush()
+            self.line_drawn = False
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _draw(self,
+              now):
+        """
+        Redraws the progress line and/or writes a JSON line for each of the current stages. Must be called with the
+        lock held.
+
+        :param now: The current time.
+
+        :return: Nothing.
+        """
+
+        segments = list()
+        for stage in self.current_stages:
+
+            stage_progress = self.stages[stage]
+            elapsed = max(now - stage_progress["start"], 1e-9)
+            files_per_s = stage_progress["files"] / elapsed
+            mb_per_s = stage_progress["bytes"] / 2**20 / elapsed
+
+            eta_s = None
+            if stage_progress["total_files"] is not None and files_per_s > 0:
+                eta_s = max(stage_progress["total_files"] - stage_progress["files"], 0) / files_per_s
+
+            if self.json_file is not None:
+                self.json_file.write(json.dumps({"time": time.time(),
+                                                 "stage": stage,
+                                                 "files": stage_progress["files"],
+                                                 "total_files": stage_progress["total_files"],
+                                                 "bytes": stage_progress["bytes"],
+                                                 "files_per_s": round(files_per_s, 3),
+                                                 "mb_per_s": round(mb_per_s, 3),
+                                                 "eta_s": None if eta_s is None else round(eta_s, 1)}) + "\n")
+
+            segment = stage + ": " + str(stage_progress["files"])
+            if stage_progress["total_files"] is not None:
+                segment += "/" + str(stage_progress["total_files"])
+            segment += " files %.1f/s" % files_per_s
+            if stage_progress["bytes"]:
+                segment += " %.1f MB/s" % mb_per_s
+            if eta_s is not None:
+                segment += " ETA " + time.strftime("%H:%M:%S", time.gmtime(eta_s))
+            segments.append(segment)
+
+        if self.json_file is not None:
+            self.json_file.flush()
+
+        if not self.active or self.notify_type != "progress":
+            return
+
+        width = shutil.get_terminal_size().columns - 1
+        sys.stdout.write("\r" + " | ".join(segments).ljust(width)[:width])
+        sys.stdout.flush()
+        self.line_drawn = True
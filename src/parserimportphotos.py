@@ -2,8 +2,11 @@
 """
 A module to manage command line parsing for the bin command.
 """
+import os
 from argparse import ArgumentParser
 
+from src import verifiedcopy
+
 help_msg = """
 A program to import image files to a catalog location, sorting them by date.
 """
@@ -31,9 +34,9 @@ class Parser(object):
         help_str += "Files and directories may be given with or without full paths. If without, the current working "
         help_str += "directory is prepended to the given paths.\n"
         help_str += "You may provide either files or directories or a mixture of both. You may provide any number of "
-        help_str += "these files or directories."
+        help_str += "these files or directories. Leave them out when using --execute-plan."
         self.parser.add_argument("import_files",
-                                 nargs="+",
+                                 nargs="*",
                                  type=str,
                                  help=help_str)
 
@@ -123,6 +126,60 @@ class Parser(object):
                                  action="store_true",
                                  help=help_str)
 
+        help_str = "Import files even if an earlier import already imported them. Every file that is imported (or "
+        help_str += "found to already exist in the catalog) is recorded in the catalog, together with its size and "
+        help_str += "modification time. By default, files that were recorded and have not changed since are skipped "
+        help_str += "before their EXIF data is read, so re-inserting a card that was already imported is quick. With "
+        help_str += "this flag, they go through the normal collision checks instead."
+        self.parser.add_argument("--reimport",
+                                 action="store_true",
+                                 help=help_str)
+
+        help_str = "Also record a partial checksum (the first and last 64KB) of every imported file, and only skip a "
+        help_str += "previously imported file if its partial checksum still matches. Safer when file modification "
+        help_str += "times cannot be trusted, at the cost of reading a little of every file."
+        self.parser.add_argument("--source-partial-hash",
+                                 action="store_true",
+                                 help=help_str)
+
+        help_str = "Work out the whole import (EXIF dates, destinations and collisions) and write it to this plan "
+        help_str += "file instead of copying anything. Collisions are listed but you are not asked about them: the "
+        help_str += "colliding files are left out of the plan. The plan can be copied later with --execute-plan. If "
+        help_str += "the file name ends in .gz, the plan is compressed."
+        self.parser.add_argument("--write-plan",
+                                 type=str,
+                                 help=help_str)
+
+        help_str = "Copy the files listed in a plan written by --write-plan. Pass only the catalog (the same one as "
+        help_str += "when the plan was written) and the same --hash, if any. Nothing is scanned and no EXIF data is "
+        help_str += "read: each file is only checked for changes to its size and modification time since the plan was "
+        help_str += "written (changed files are skipped and listed). Files whose checksums were known when the plan "
+        help_str += "was written are checked against them once they have been copied."
+        self.parser.add_argument("--execute-plan",
+                                 type=str,
+                                 help=help_str)
+
+        help_str = "Resume an import that was interrupted. Every copy is recorded in a journal in the catalog, and "
+        help_str += "files that the interrupted import already copied and verified (and that have not changed since) "
+        help_str += "are skipped without being read again. Without this flag, any journal left behind by an earlier "
+        help_str += "import is discarded."
+        self.parser.add_argument("--resume",
+                                 action="store_true",
+                                 help=help_str)
+
+        help_str = "Instead of printing a line for every file, show a single progress line (files, throughput and "
+        help_str += "ETA for the current stage) that is redrawn twice a second. Much faster when importing hundreds "
+        help_str += "of thousands of files to a slow terminal."
+        self.parser.add_argument("--progress",
+                                 action="store_true",
+                                 help=help_str)
+
+        help_str = "Append the progress of each stage to this file as JSON lines, at the same rate as the progress "
+        help_str += "line is redrawn. Works with or without --progress and --silent."
+        self.parser.add_argument("--progress-json",
+                                 type=str,
+                                 help=help_str)
+
         help_str = "Use this flag to run the import as a trial run. This will display all the files that would have "
         help_str += "been copied, but not actually make any changes on disk. This is a good way to evaluate the "
         help_str += "import before actually running it."
@@ -131,6 +188,116 @@ class Parser(object):
                                  action="store_true",
                                  help=help_str)
 
+        help_str = "By default any file whose contents already exist anywhere in the catalog (even under a different "
+        help_str += "name or date folder) is skipped. Use this flag to only flag files that would land on exactly the "
+        help_str += "same path as an existing catalog file."
+        self.parser.add_argument("--no-catalog-dedupe",
+                                 action="store_true",
+                                 help=help_str)
+
+        help_str = "The number of files to process at the same time while reading EXIF data. Raising this keeps more "
+        help_str += "reads in flight, which helps on fast disks and when importing from several devices at once. "
+        help_str += "Defaults to 1."
+        self.parser.add_argument("-j",
+                                 "--jobs",
+                                 type=int,
+                                 default=1,
+                                 help=help_str)
+
+        help_str = "By default the files of each device being imported from (card reader, external disk, ...) are "
+        help_str += "read and copied by workers of their own, so that several devices are read at the same time. "
+        help_str += "Spinning disks and memory cards are only read one file at a time, while SSDs get as many "
+        help_str += "workers as --jobs and --copy-jobs ask for. Use this flag to read all of the devices through a "
+        help_str += "single pool of workers instead."
+        self.parser.add_argument("--no-device-lanes",
+                                 action="store_true",
+                                 help=help_str)
+
+        help_str = "Check the catalog with this many filesystem operations in flight at the same time. On a catalog "
+        help_str += "that lives on a network filesystem (SMB, NFS) every check for an existing file, every new "
+        help_str += "directory and every read of a catalog file costs a round trip to the server. With this option "
+        help_str += "they are issued together in batches, and every stat result is cached for the rest of the run. 0 "
+        help_str += "checks one file at a time. Defaults to 0."
+        self.parser.add_argument("--async-io",
+                                 type=int,
+                                 default=0,
+                                 help=help_str)
+
+        help_str = "Keep the catalog's checksum index in SQLite's write-ahead-log mode, so that an import and a scrub "
+        help_str += "of the same catalog never wait for each other to read it. Only use this for a catalog on a local "
+        help_str += "disk: SQLite does not support write-ahead-log mode on network filesystems (SMB, NFS)."
+        self.parser.add_argument("--wal",
+                                 action="store_true",
+                                 help=help_str)
+
+        help_str = "How files are copied into the catalog. \"reflink\" clones files that are on the same btrfs/XFS "
+        help_str += "filesystem as the catalog, so no data is written (each file is still read once to checksum it). "
+        help_str += "\"copy_file_range\" and \"sendfile\" let the kernel copy the data without it passing through "
+        help_str += "this program, but the source then has to be read again to verify the copy. \"python\" reads "
+        help_str += "the data in and checksums the source while copying it. \"auto\" uses a reflink where it can "
+        help_str += "and python otherwise. It never picks copy_file_range or sendfile on its own: they save passing "
+        help_str += "the data through this program, but reading the source a second time to verify the copy costs "
+        help_str += "more than that saves. They are worth choosing when the catalog is on a network filesystem whose "
+        help_str += "server can copy the data itself. Backends that are not supported fall back automatically. "
+        help_str += "Defaults to auto."
+        self.parser.add_argument("--copy-mode",
+                                 choices=verifiedcopy.COPY_MODES,
+                                 default="auto",
+                                 help=help_str)
+
+        help_str = "The hash algorithm used to verify copies and to compare files. blake2b and sha256 are faster than "
+        help_str += "md5 on most modern CPUs. xxh3_128 and blake3 are much faster still, but are only available if "
+        help_str += "the xxhash or blake3 modules are installed. The algorithm is recorded next to every checksum "
+        help_str += "stored for the catalog, so changing it later is safe. Defaults to md5."
+        self.parser.add_argument("--hash",
+                                 dest="hash_algorithm",
+                                 choices=verifiedcopy.HASH_ALGORITHMS,
+                                 default=verifiedcopy.DEFAULT_HASH_ALGORITHM,
+                                 help=help_str)
+
+        help_str = "The number of images (each together with its sidecar) to copy and verify at the same time. "
+        help_str += "Defaults to 1."
+        self.parser.add_argument("--copy-jobs",
+                                 type=int,
+                                 default=1,
+                                 help=help_str)
+
+        help_str = "The maximum number of megabytes being copied at the same time when --copy-jobs is more than 1. "
+        help_str += "Defaults to 1024."
+        self.parser.add_argument("--max-in-flight",
+                                 type=int,
+                                 default=1024,
+                                 help=help_str)
+
+        help_str = "How many times to retry copying an image whose copy or verification failed before reporting it as "
+        help_str += "an error. Defaults to 0."
+        self.parser.add_argument("--copy-retries",
+                                 type=int,
+                                 default=0,
+                                 help=help_str)
+
+        help_str = "Write a JSON report of the run to this file. The report holds the wall time and number of files "
+        help_str += "for each stage, plus the bytes read, hashed and written, cache hits, EXIF fallbacks and copy "
+        help_str += "retries."
+        self.parser.add_argument("--report",
+                                 type=str,
+                                 help=help_str)
+
+        help_str = "Profile the run with cProfile and write the stats to this file (readable with pstats or snakeviz). "
+        help_str += "The worker threads that read EXIF data and copy files are profiled too, and their stats are "
+        help_str += "merged with those of the main thread."
+        self.parser.add_argument("--profile",
+                                 type=str,
+                                 help=help_str)
+
+        help_str = "Runs the import as a streaming pipeline: files are copied as soon as their EXIF data has been read "
+        help_str += "and they have been checked for collisions, and memory use stays flat no matter how many files are "
+        help_str += "imported. Because nothing is known about later files when the first ones are copied, you are "
+        help_str += "not asked about collisions. Colliding files are skipped and listed at the end instead."
+        self.parser.add_argument("--stream",
+                                 action="store_true",
+                                 help=help_str)
+
         self.args = self.parser.parse_args(commandline_args)
 
     # ------------------------------------------------------------------------------------------------------------------
@@ -142,5 +309,30 @@ class Parser(object):
         :return: Nothing.
         """
 
-        pass
+        if self.args.jobs < 1:
+            raise ValueError("The number of jobs must be at least 1.")
+
+        if self.args.copy_jobs < 1:
+            raise ValueError("The number of copy jobs must be at least 1.")
+
+        if self.args.copy_retries < 0:
+            raise ValueError("The number of copy retries cannot be negative.")
+
+        if self.args.max_in_flight < 1:
+            raise ValueError("The maximum number of megabytes in flight must be at least 1.")
+
+        if self.args.force_types and not self.args.additional_types:
+            raise ValueError("--force-types needs the types to import to be given with --additional-types.")
+
+        if self.args.write_plan and self.args.execute_plan:
+            raise ValueError("--write-plan and --execute-plan cannot be used together.")
+
+        if self.args.execute_plan and not os.path.isfile(self.args.execute_plan):
+            raise FileNotFoundError("The plan file does not exist: " + self.args.execute_plan)
+
+        if self.args.execute_plan and self.args.import_files:
+            raise ValueError("Files to import cannot be given with --execute-plan. The plan lists the files to copy.")
+
+        if not self.args.execute_plan and not self.args.import_files:
+            raise ValueError("No files or directories to import were given.")
 
@@ -0,0 +1,145 @@
+#! /usr/bin/env python3
+"""
+A module to manage command line parsing for the scrubCatalog command.
+"""
+import os
+from argparse import ArgumentParser
+
+from src import verifiedcopy
+
+help_msg = """
+A program to check the files in an image catalog for bit rot. Every file is read again and its checksum is compared
+with the one that was stored when it was imported. The files that have gone the longest without being checked are
+checked first, so a scrub may be stopped at any time (or limited with the options below) and the next one carries on
+where it left off.
+"""
+
+
+class Parser(object):
+    """
+    A class to manage a single argparse object.
+    """
+
+    # ----------------------------------------------------------------------------------------------------------------------
+    def __init__(self,
+                 commandline_args):
+        """
+        Creates and initializes the parser object.
+
+        :param commandline_args: The arguments passed on the command line.
+
+        :return: Nothing.
+        """
+
+        self.parser = ArgumentParser(description=help_msg)
+
+        help_str = "Catalog location. This is the path to the root of the photo catalog."
+        self.parser.add_argument("catalog",
+                                 type=str,
+                                 help=help_str)
+
+        help_str = "The number of files to read at the same time. Raising this helps on SSDs and RAID arrays. "
+        help_str += "Defaults to 1."
+        self.parser.add_argument("-j",
+                                 "--jobs",
+                                 type=int,
+                                 default=1,
+                                 help=help_str)
+
+        help_str = "The maximum number of megabytes to read per second, shared by all of the jobs, so that the scrub "
+        help_str += "can run in the background while the catalog is in use. Defaults to 0 (no limit)."
+        self.parser.add_argument("--max-rate",
+                                 type=float,
+                                 default=0,
+                                 help=help_str)
+
+        help_str = "Stop after this many files have been checked. The next scrub carries on with the files that "
+        help_str += "were not checked."
+        self.parser.add_argument("--max-files",
+                                 type=int,
+                                 help=help_str)
+
+        help_str = "Stop after this many gigabytes have been read. The next scrub carries on with the files that "
+        help_str += "were not checked."
+        self.parser.add_argument("--max-gb",
+                                 type=float,
+                                 help=help_str)
+
+        help_str = "Stop starting to check new files after this many minutes. The next scrub carries on with the "
+        help_str += "files that were not checked."
+        self.parser.add_argument("--max-minutes",
+                                 type=float,
+                                 help=help_str)
+
+        help_str = "Only check files that were last checked (or imported) more than this many days ago. Files that "
+        help_str += "have no checksum yet are always hashed. Defaults to 0 (check every file once)."
+        self.parser.add_argument("--older-than",
+                                 type=float,
+                                 default=0,
+                                 help=help_str)
+
+        help_str = "The hash algorithm used for files that have no checksum yet, or that have been changed since they "
+        help_str += "were hashed. Files that already have a checksum are always checked with the algorithm that is "
+        help_str += "recorded next to it. Defaults to md5."
+        self.parser.add_argument("--hash",
+                                 dest="hash_algorithm",
+                                 choices=verifiedcopy.HASH_ALGORITHMS,
+                                 default=verifiedcopy.DEFAULT_HASH_ALGORITHM,
+                                 help=help_str)
+
+        help_str = "Keep the catalog's checksum index in SQLite's write-ahead-log mode, so that an import and a scrub "
+        help_str += "of the same catalog never wait for each other to read it. Only use this for a catalog on a local "
+        help_str += "disk: SQLite does not support write-ahead-log mode on network filesystems (SMB, NFS)."
+        self.parser.add_argument("--wal",
+                                 action="store_true",
+                                 help=help_str)
+
+        help_str = "Runs silently. Does not print status to the command line as the program checks files."
+        self.parser.add_argument("-S",
+                                 "--silent",
+                                 action="store_true",
+                                 help=help_str)
+
+        help_str = "Instead of printing a line for every file, show a single progress line (files and throughput) "
+        help_str += "that is redrawn twice a second."
+        self.parser.add_argument("--progress",
+                                 action="store_true",
+                                 help=help_str)
+
+        help_str = "Write a JSON report of the run to this file. The report holds the wall time and number of files "
+        help_str += "checked, plus the bytes read and hashed."
+        self.parser.add_argument("--report",
+                                 type=str,
+                                 help=help_str)
+
+        self.args = self.parser.parse_args(commandline_args)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def validate(self):
+        """
+        Validates that the command line arguments are valid. Raises an appropriate error if any of the checks fail
+        validation.
+
+        :return: Nothing.
+        """
+
+        if not os.path.isdir(self.args.catalog):
+            raise NotADirectoryError("The catalog is not a directory: " + self.args.catalog)
+
+        if self.args.jobs < 1:
+            raise ValueError("The number of jobs must be at least 1.")
+
+        if self.args.max_rate < 0:
+            raise ValueError("The maximum rate cannot be negative.")
+
+        if self.args.max_files is not None and self.args.max_files < 1:
+            raise ValueError("The maximum number of files must be at least 1.")
+
+        if self.args.max_gb is not None and self.args.max_gb <= 0:
+            raise ValueError("The maximum number of gigabytes must be more than 0.")
+
+        if self.args.max_minutes is not None and self.args.max_minutes <= 0:
+            raise ValueError("The maximum number of minutes must be more than 0.")
+
+        if self.args.older_than < 0:
+            raise ValueError("The number of days cannot be negative.")
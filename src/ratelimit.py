@@ -0,0 +1,58 @@
+import threading
+import time
+
+
+class TokenBucket(object):
+    """
+    A class to cap the rate at which something (bytes read, usually) is consumed, shared by any number of threads.
+
+    Tokens flow into the bucket at a fixed rate, up to a maximum (the burst). Consuming more tokens than the bucket
+    holds is allowed, but the bucket then goes into debt and the caller sleeps until the debt has been paid off. Over
+    any stretch of time longer than a second or two, the rate therefore never exceeds the one that was asked for, no
+    matter how many threads share the bucket or how large each request is.
+    """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self,
+                 rate,
+                 burst=None):
+        """
+        Sets up a full bucket.
+
+        :param rate: The number of tokens that flow into the bucket per second.
+        :param burst: The most tokens the bucket can hold. Defaults to one second's worth.
+        """
+
+        assert rate > 0
+
+        self.rate = float(rate)
+        self.burst = float(rate if burst is None else burst)
+
+        self.tokens = self.burst
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def consume(self,
+                amount):
+        """
+        Takes tokens from the bucket, sleeping for as long as it takes for the bucket to have paid for them.
+
+        :param amount: The number of tokens to take.
+
+        :return: The number of seconds that were spent sleeping.
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            self.tokens -= amount
+            wait = 0.0
+            if self.tokens < 0:
+                wait = -self.tokens / self.rate
+
+        if wait > 0:
+            time.sleep(wait)
+
+        return wait
@@ -0,0 +1,176 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# The report that is currently collecting counts, if any. The modules that do the actual work call count() without
+# having to be handed the report object, and count() does nothing at all when no report is active.
+active_report = None
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def count(name,
+          amount=1):
+    """
+    Adds to a counter in the active run report. Does nothing if there is no active report.
+
+    :param name: The name of the counter (e.g. "bytes_read").
+    :param amount: How much to add. Defaults to 1.
+
+    :return: Nothing.
+    """
+
+    if active_report is not None:
+        active_report.count(name, amount)
+
+
+class RunReport(object):
+    """
+    A class to collect per-stage instrumentation for a single import run: wall time and files processed for each stage,
+    plus counters (bytes read, hashed and written, cache hits, EXIF fallbacks, copy retries, etc.) that are attributed
+    to whichever stage is running when they are counted.
+    """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self,
+                 arguments=None):
+        """
+        Sets up an empty report and makes it the active report.
+
+        :param arguments: An optional dictionary of the command line arguments, to be included in the report.
+        """
+
+        global active_report
+
+        self.arguments = arguments
+        self.started = time.time()
+        self.start_time = time.perf_counter()
+        self.finished = None
+
+        self.lock = threading.Lock()
+        self.stages = dict()
+        self.stage_order = list()
+        self.current_stage = None
+        self.totals = dict()
+        self.info = dict()
+
+        active_report = self
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def count(self,
+              name,
+              amount=1):
+        """
+        Adds to a counter, both in the totals and in the stage that is currently running.
+
+        :param name: The name of the counter.
+        :param amount: How much to add. Defaults to 1.
+
+        :return: Nothing.
+        """
+
+        with self.lock:
+            self.totals[name] = self.totals.get(name, 0) + amount
+            if self.current_stage is not None:
+                counters = self.stages[self.current_stage]["counters"]
+                counters[name] = counters.get(name, 0) + amount
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def set_info(self,
+                 name,
+                 value):
+        """
+        Records a piece of information about the run that is not a counter (e.g. the copy mode that was used).
+
+        :param name: The name of the item.
+        :param value: The value. Must be JSON serializable.
+
+        :return: Nothing.
+        """
+
+        with self.lock:
+            self.info[name] = value
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @contextmanager
+    def stage(self,
+              name):
+        """
+        A context manager that times a stage. Yields a dictionary whose "files" entry the caller should set to the
+        number of files the stage processed.
+
+        :param name: The name of the stage.
+
+        :return: A generator (for use with the "with" statement).
+        """
+
+        with self.lock:
+            stage = {"wall_s": 0.0, "files": 0, "counters": dict()}
+            self.stages[name] = stage
+            self.stage_order.append(name)
+            previous_stage = self.current_stage
+            self.current_stage = name
+
+        start_time = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            with self.lock:
+                stage["wall_s"] = round(time.perf_counter() - start_time, 6)
+                self.current_stage = previous_stage
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def finish(self):
+        """
+        Marks the end of the run and stops collecting counts.
+
+        :return: Nothing.
+        """
+
+        global active_report
+
+        self.finished = time.time()
+        self.wall_s = round(time.perf_counter() - self.start_time, 6)
+        if active_report is self:
+            active_report = None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def as_dict(self):
+        """
+        Returns the report as a dictionary.
+
+        :return: The dictionary.
+        """
+
+        if self.finished is None:
+            self.finish()
+
+        stages = dict()
+        for name in self.stage_order:
+            stage = dict(self.stages[name])
+            if stage["wall_s"]:
+                stage["files_per_s"] = round(stage["files"] / stage["wall_s"], 3)
+            stages[name] = stage
+
+        return {"started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                "finished": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.finished)),
+                "wall_s": self.wall_s,
+                "arguments": self.arguments,
+                "info": self.info,
+                "stages": stages,
+                "totals": self.totals}
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def write(self,
+              report_path):
+        """
+        Writes the report to a JSON file.
+
+        :param report_path: The path to the file.
+
+        :return: Nothing.
+        """
+
+        with open(report_path, "w") as f:
+            json.dump(self.as_dict(), f, indent=2, default=str)
+            f.write("\n")
@@ -0,0 +1,124 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class SidecarResolver(object):
+    """
+    A class to find the sidecar files for images without probing the disk for every possible sidecar name. Each source
+    directory is listed once, and every image in that directory is then matched against that listing. The matching
+    rules are the same as those of Image.find_sidecar.
+    """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self,
+                 sidecar_extensions=None,
+                 max_listings=256):
+        """
+        Sets up the resolver.
+
+        :param sidecar_extensions: A list of possible file extensions for sidecar files, in order of priority. Defaults
+               to ["xmp"].
+        :param max_listings: The number of directory listings to keep. Once there are more, the least recently used
+               listing is dropped so that memory use stays bounded on very large imports. Defaults to 256.
+        """
+
+        if sidecar_extensions is None:
+            self.sidecar_extensions = ["xmp"]
+        else:
+            self.sidecar_extensions = [sidecar_extension.lstrip(".") for sidecar_extension in sidecar_extensions]
+
+        # Keyed on directory. The value is a tuple of (a set of the names in the directory, a set of the lower case
+        # names in the directory if the file system is case-insensitive or None if it is case-sensitive).
+        self.listings = OrderedDict()
+        self.max_listings = max_listings
+        self.lock = threading.Lock()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @staticmethod
+    def _is_case_insensitive(dir_path,
+                             names):
+        """
+        Determines whether the file system that holds a directory ignores case, by looking up one of its entries with
+        the case of the name swapped.
+
+        :param dir_path: The path to the directory.
+        :param names: The names of the entries in the directory.
+
+        :return: True if the file system is case-insensitive, False otherwise.
+        """
+
+        for name in names:
+            swapped = name.swapcase()
+            if swapped != name and swapped not in names:
+                return os.path.exists(os.path.join(dir_path or ".", swapped))
+
+        return False
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _listing(self,
+                 dir_path):
+        """
+        Returns the (cached) listing of a directory. The directory is listed without holding the lock, so that threads
+        resolving sidecars in different directories do not wait for each other. If two threads list the same directory
+        at once, the first listing to be stored is kept.
+
+        :param dir_path: The path to the directory.
+
+        :return: A tuple of (the set of names, the set of lower case names or None).
+        """
+
+        with self.lock:
+            try:
+                self.listings.move_to_end(dir_path)
+                return self.listings[dir_path]
+            except KeyError:
+                pass
+
+        try:
+            names = set(os.listdir(dir_path or "."))
+        except OSError:
+            names = set()
+
+        lower_names = None
+        if self._is_case_insensitive(dir_path, names):
+            lower_names = {name.lower() for name in names}
+
+        with self.lock:
+            try:
+                self.listings.move_to_end(dir_path)
+                return self.listings[dir_path]
+            except KeyError:
+                pass
+
+            self.listings[dir_path] = (names, lower_names)
+            if len(self.listings) > self.max_listings:
+                self.listings.popitem(last=False)
+
+            return names, lower_names
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def find_sidecar(self,
+                     source_path):
+        """
+        Finds the sidecar file associated with an image. Looks for image_name.ext and image_name.original_ext.ext, in
+        lower and then upper case, for each extension in turn.
+
+        :param source_path: The full path to the image.
+
+        :return: The path to the sidecar file, or None if there is none.
+        """
+
+        dir_path, file_name = os.path.split(source_path)
+        names, lower_names = self._listing(dir_path)
+        stem = os.path.splitext(file_name)[0]
+
+        for ext in self.sidecar_extensions:
+            for potential_name in (stem + "." + ext.lower(),
+                                   stem + "." + ext.upper(),
+                                   file_name + "." + ext.lower(),
+                                   file_name + "." + ext.upper()):
+                if potential_name in names or (lower_names is not None and potential_name.lower() in lower_names):
+                    return os.path.join(dir_path, potential_name)
+
+        return None
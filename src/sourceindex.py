@@ -0,0 +1,312 @@
+import os
+import sqlite3
+import threading
+import time
+
+from src import runreport
+from src import verifiedcopy
+from src.checksumindex import STATE_DIR_NAME
+
+SOURCE_INDEX_FILE_NAME = "sources.db"
+
+# Where Linux keeps a symlink per filesystem UUID, pointing at the device node of that filesystem.
+DISK_BY_UUID_DIR = "/dev/disk/by-uuid"
+
+
+class SourceIndex(object):
+    """
+    A persistent, on-disk record of the source files that have already been imported into the catalog (either copied, or
+    found to already exist in the catalog). Before any exif data is read or any file is hashed, files that are in the
+    index and have not changed since can be dropped from the import. Importing a memory card a second time then only
+    costs a stat of each file.
+
+    Each entry is keyed on the volume the file lives on and the path of the file relative to the root (mount point) of
+    that volume, so a card is recognized no matter where it is mounted. A volume is identified by its filesystem UUID
+    where the platform makes that available, and by its mount point otherwise. An entry stores the size and
+    modification time of the file, the size and modification time of its sidecar (or that it had none) and, optionally,
+    a partial checksum. A file that had no sidecar when it was imported is not considered imported any more once a
+    sidecar appears next to it, so that the sidecar is imported too.
+
+    The index may be shared between threads. All access to the database is serialized.
+    """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self,
+                 catalog_path,
+                 partial_hash=False,
+                 hash_algorithm=verifiedcopy.DEFAULT_HASH_ALGORITHM,
+                 commit_frequency=1000,
+                 sidecar_resolver=None,
+                 commit_interval=1.0):
+        """
+        Opens (and creates if needed) the index that lives in the catalog's state directory.
+
+        :param catalog_path: The full path where the image catalog lives.
+        :param partial_hash: If True, a partial checksum (the first and last blocks) of every file is recorded, and a
+               file is only considered to be already imported if its partial checksum still matches. Defaults to False.
+        :param hash_algorithm: The hash algorithm used for the partial checksums. Defaults to md5.
+        :param commit_frequency: How many changes to accumulate before committing them to disk. Defaults to 1000.
+        :param sidecar_resolver: The sidecar resolver object used to look for sidecars that have appeared since a file
+               was imported. If None (because sidecars are not being imported), no sidecars are looked for. Defaults to
+               None.
+        :param commit_interval: The most seconds a change may wait before it is committed, whatever the number of
+               changes, so that an interrupted import loses at most this much of its record. Defaults to 1.
+        """
+
+        self.partial_hash = partial_hash
+        self.hash_algorithm = hash_algorithm
+        self.commit_frequency = commit_frequency
+        self.commit_interval = commit_interval
+        self.pending_count = 0
+        self.last_commit = time.monotonic()
+        self.sidecar_resolver = sidecar_resolver
+
+        self.mount_points = dict()
+        self.volume_ids = dict()
+
+        state_dir = os.path.join(os.path.abspath(catalog_path), STATE_DIR_NAME)
+        os.makedirs(state_dir, exist_ok=True)
+        self.index_path = os.path.join(state_dir, SOURCE_INDEX_FILE_NAME)
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.index_path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS sources ("
+                                "volume_id TEXT NOT NULL, "
+                                "rel_path TEXT NOT NULL, "
+                                "size INTEGER NOT NULL, "
+                                "mtime_ns INTEGER NOT NULL, "
+                                "partial_digest BLOB, "
+                                "algorithm TEXT, "
+                                "sidecar_rel_path TEXT, "
+                                "sidecar_size INTEGER, "
+                                "sidecar_mtime_ns INTEGER, "
+                                "imported REAL NOT NULL, "
+                                "PRIMARY KEY (volume_id, rel_path))")
+        self.connection.commit()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def find_sidecar(self,
+                     file_p):
+        """
+        Finds the sidecar of a source file.
+
+        :param file_p: The path to the source file.
+
+        :return: The path to the sidecar, or None if it has none or sidecars are not being imported.
+        """
+
+        if self.sidecar_resolver is None:
+            return None
+
+        return self.sidecar_resolver.find_sidecar(os.path.abspath(file_p))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def mount_point(self,
+                    file_p):
+        """
+        Returns the mount point of the filesystem the file lives on. The result is cached per directory.
+
+        :param file_p: The path to the file.
+
+        :return: The path of the mount point.
+        """
+
+        dir_path = os.path.dirname(os.path.abspath(file_p))
+        try:
+            return self.mount_points[dir_path]
+        except KeyError:
+            pass
+
+        path = dir_path
+        while not os.path.ismount(path):
+            parent = os.path.dirname(path)
+            if parent == path:
+                break
+            path = parent
+
+        self.mount_points[dir_path] = path
+        return path
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def volume_id(self,
+                  mount_point):
+        """
+        Returns an identifier for the volume mounted at the given mount point that stays the same no matter where the
+        volume is mounted: "uuid:" followed by the filesystem UUID where it can be found, or "path:" followed by the
+        mount point otherwise.
+
+        :param mount_point: The mount point of the volume.
+
+        :return: The volume identifier.
+        """
+
+        try:
+            return self.volume_ids[mount_point]
+        except KeyError:
+            pass
+
+        volume_id = "path:" + mount_point
+        try:
+            device = os.stat(mount_point).st_dev
+            for uuid in os.listdir(DISK_BY_UUID_DIR):
+                try:
+                    if os.stat(os.path.join(DISK_BY_UUID_DIR, uuid)).st_rdev == device:
+                        volume_id = "uuid:" + uuid
+                        break
+                except OSError:
+                    continue
+        except OSError:
+            pass
+
+        self.volume_ids[mount_point] = volume_id
+        return volume_id
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def key(self,
+            file_p):
+        """
+        Returns the key of the file in the index.
+
+        :param file_p: The path to the file.
+
+        :return: A tuple of (the volume identifier, the mount point, the path of the file relative to the mount point).
+        """
+
+        mount_point = self.mount_point(file_p)
+        return self.volume_id(mount_point), mount_point, os.path.relpath(os.path.abspath(file_p), mount_point)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @staticmethod
+    def _stat_matches(file_p,
+                      size,
+                      mtime_ns):
+        """
+        Checks that a file still exists with the given size and modification time.
+
+        :param file_p: The path to the file.
+        :param size: The expected size.
+        :param mtime_ns: The expected modification time in nanoseconds.
+
+        :return: True if the file exists and matches, False otherwise.
+        """
+
+        try:
+            stat_result = os.stat(file_p)
+        except OSError:
+            return False
+
+        return stat_result.st_size == size and stat_result.st_mtime_ns == mtime_ns
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def is_imported(self,
+                    file_p):
+        """
+        Checks whether the file has already been imported and has not changed since (nor has its sidecar, and no
+        sidecar has appeared if it had none). Unless partial checksums are enabled, only the size and modification time
+        of the file are checked.
+
+        :param file_p: The path to the source file.
+
+        :return: True if the file has already been imported, False otherwise.
+        """
+
+        volume_id, mount_point, rel_path = self.key(file_p)
+
+        with self.lock:
+            row = self.connection.execute("SELECT size, mtime_ns, partial_digest, algorithm, sidecar_rel_path, "
+                                          "sidecar_size, sidecar_mtime_ns FROM sources "
+                                          "WHERE volume_id = ? AND rel_path = ?",
+                                          (volume_id, rel_path)).fetchone()
+        if row is None:
+            return False
+
+        if not self._stat_matches(file_p, row[0], row[1]):
+            return False
+
+        # An empty sidecar path records that the file had no sidecar. Entries written before that was recorded have
+        # none at all, and are treated the same way.
+        if row[4]:
+            if not self._stat_matches(os.path.join(mount_point, row[4]), row[5], row[6]):
+                return False
+        elif self.find_sidecar(file_p) is not None:
+            return False
+
+        if self.partial_hash:
+            if row[2] is None or row[3] != self.hash_algorithm:
+                return False
+            if verifiedcopy.partial_digest_for_file(file_p, self.hash_algorithm) != row[2]:
+                return False
+
+        return True
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def record(self,
+               file_p,
+               sidecar_p=None):
+        """
+        Records that a source file (and its sidecar, if given) has been imported.
+
+        :param file_p: The path to the source file.
+        :param sidecar_p: The path to the source file's sidecar, or None if it has none. That it had none is recorded
+               too, so that a sidecar that appears later is noticed. Defaults to None.
+
+        :return: Nothing.
+        """
+
+        volume_id, mount_point, rel_path = self.key(file_p)
+        stat_result = os.stat(file_p)
+
+        partial_digest = None
+        algorithm = None
+        if self.partial_hash:
+            partial_digest = verifiedcopy.partial_digest_for_file(file_p, self.hash_algorithm)
+            algorithm = self.hash_algorithm
+
+        sidecar_rel_path = ""
+        sidecar_size = None
+        sidecar_mtime_ns = None
+        if sidecar_p is not None:
+            sidecar_stat_result = os.stat(sidecar_p)
+            sidecar_rel_path = os.path.relpath(os.path.abspath(sidecar_p), mount_point)
+            sidecar_size = sidecar_stat_result.st_size
+            sidecar_mtime_ns = sidecar_stat_result.st_mtime_ns
+
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO sources "
+                                    "(volume_id, rel_path, size, mtime_ns, partial_digest, algorithm, "
+                                    "sidecar_rel_path, sidecar_size, sidecar_mtime_ns, imported) "
+                                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                    (volume_id, rel_path, stat_result.st_size, stat_result.st_mtime_ns,
+                                     partial_digest, algorithm, sidecar_rel_path, sidecar_size, sidecar_mtime_ns,
+                                     time.time()))
+            self._changed()
+
+        runreport.count("source_index_recorded")
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _changed(self):
+        """
+        Counts a change and commits once enough changes have accumulated, or once the oldest of them has waited long
+        enough. Must be called with the lock held.
+
+        :return: Nothing.
+        """
+
+        self.pending_count += 1
+        now = time.monotonic()
+        if self.pending_count >= self.commit_frequency or now - self.last_commit >= self.commit_interval:
+            self.connection.commit()
+            self.pending_count = 0
+            self.last_commit = now
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def close(self):
+        """
+        Commits any outstanding changes and closes the index.
+
+        :return: Nothing.
+        """
+
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
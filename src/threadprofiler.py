@@ -0,0 +1,91 @@
+import cProfile
+import pstats
+import sys
+import threading
+
+
+class ThreadProfiler(object):
+    """
+    A class to profile a run with cProfile, including the worker threads (EXIF reads, copies, async filesystem calls)
+    that do most of the work. cProfile on its own only profiles the thread that enabled it, so every thread started
+    while the profiler is running gets a profiler of its own, and all of them are merged into a single stats file at
+    the end.
+    """
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self):
+        """
+        Sets up the profiler.
+        """
+
+        self.lock = threading.Lock()
+        self.main_profiler = cProfile.Profile()
+        self.thread_profilers = list()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _start_thread(self,
+                      frame,
+                      event,
+                      arg):
+        """
+        Installed with threading.setprofile, so that it is called once at the start of every new thread. Replaces
+        itself with a profiler for that thread.
+
+        :param frame: The current frame.
+        :param event: The profiling event.
+        :param arg: The argument of the event.
+
+        :return: Nothing.
+        """
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Where cProfile is built on sys.monitoring (Python 3.12 and up) only one profiler may be active, and the
+            # main one already sees every thread.
+            sys.setprofile(None)
+            return
+
+        with self.lock:
+            self.thread_profilers.append(profiler)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def start(self):
+        """
+        Starts profiling this thread and every thread started from now on.
+
+        :return: Nothing.
+        """
+
+        threading.setprofile(self._start_thread)
+        self.main_profiler.enable()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def stop(self):
+        """
+        Stops profiling. Threads started from now on are not profiled. Worker threads should have finished before the
+        stats are dumped.
+
+        :return: Nothing.
+        """
+
+        self.main_profiler.disable()
+        threading.setprofile(None)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def dump_stats(self,
+                   stats_path):
+        """
+        Merges the stats of every thread and writes them to a file that pstats or snakeviz can read.
+
+        :param stats_path: The path to the file.
+
+        :return: Nothing.
+        """
+
+        stats = pstats.Stats(self.main_profiler)
+        with self.lock:
+            for profiler in self.thread_profilers:
+                stats.add(profiler)
+        stats.dump_stats(stats_path)
@@ -1,46 +1,213 @@
+import errno
 import hashlib
 import os.path
 import shutil
+import threading
+
+from src import runreport
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+# The ioctl request number for FICLONE on Linux (_IOW(0x94, 9, int)).
+FICLONE = 0x40049409
+
+COPY_MODES = ["auto", "reflink", "copy_file_range", "sendfile", "python"]
+
+# The order in which backends are tried in auto mode. Reflinks are only attempted when source and destination are on
+# the same device. The kernel backends are left out: they do not hand back the source checksum, so verifying their copy
+# means reading the source a second time, which costs more than the copy through user space saves.
+AUTO_COPY_MODES = ["reflink", "python"]
+
+# Errors that mean a backend is not supported for a particular source/destination pair (as opposed to a real I/O
+# error).
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOSYS, errno.EINVAL, errno.EBADF,
+                      errno.ETXTBSY, errno.ENOTTY}
+
+# The digest algorithms that can be used to verify copies and compare files. xxh3_128 and blake3 are only available if
+# the xxhash and blake3 modules are installed.
+HASH_ALGORITHMS = ["md5", "sha256", "blake2b"]
+if xxhash is not None:
+    HASH_ALGORITHMS.append("xxh3_128")
+if blake3 is not None:
+    HASH_ALGORITHMS.append("blake3")
+
+DEFAULT_HASH_ALGORITHM = "md5"
+
+# The suffix of the temporary files that copies are written to before they are verified and renamed.
+TEMP_SUFFIX = ".importPhotos-partial"
+
+# One read buffer per thread, reused for every file that thread hashes or copies.
+_buffers = threading.local()
+
+# Backends that have failed for a given (source device, destination device) pair, so that they are not tried again.
+_unsupported_backends = dict()
+_unsupported_backends_lock = threading.Lock()
 
 
 # ----------------------------------------------------------------------------------------------------------------------
-def md5_for_file(file_p,
-                 block_size=2**20):
+def new_hash(hash_algorithm=DEFAULT_HASH_ALGORITHM):
     """
-    Create an md5 checksum for a file without reading the whole file in in a single chunk.
+    Creates a new hash object for the given algorithm.
+
+    :param hash_algorithm: One of HASH_ALGORITHMS. Defaults to md5.
+
+    :return: A hash object with update() and digest() methods.
+    """
+
+    if hash_algorithm not in HASH_ALGORITHMS:
+        raise ValueError("Unsupported hash algorithm: " + str(hash_algorithm))
+
+    if hash_algorithm == "xxh3_128":
+        return xxhash.xxh3_128()
+    if hash_algorithm == "blake3":
+        return blake3.blake3()
+
+    return hashlib.new(hash_algorithm)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _get_buffer(block_size):
+    """
+    Returns this thread's read buffer, (re)allocating it only if it is not the requested size.
+
+    :param block_size: The size of the buffer.
+
+    :return: A tuple of (the bytearray, a memoryview of it).
+    """
+
+    buffer = getattr(_buffers, "buffer", None)
+    if buffer is None or len(buffer) != block_size:
+        buffer = bytearray(block_size)
+        _buffers.buffer = buffer
+        _buffers.view = memoryview(buffer)
+
+    return buffer, _buffers.view
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def digest_for_file(file_p,
+                    hash_algorithm=DEFAULT_HASH_ALGORITHM,
+                    block_size=2**20,
+                    rate_limiter=None):
+    """
+    Create a checksum for a file without reading the whole file in in a single chunk. The file is read into a buffer
+    that is reused for every chunk (and every file hashed by the same thread).
 
     :param file_p: The path to the file we are getting a checksum for.
+    :param hash_algorithm: One of HASH_ALGORITHMS. Defaults to md5.
     :param block_size: How much to read in in a single chunk. Defaults to 1MB
+    :param rate_limiter: An optional rate limiter object (see ratelimit.py). Every chunk that is read is charged to it,
+           so that the file is not read faster than the limiter allows. Defaults to None.
 
-    :return: The md5 checksum.
+    :return: The checksum.
+    """
+
+    return digests_for_file(file_p, [hash_algorithm], block_size, rate_limiter)[0]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def digests_for_file(file_p,
+                     hash_algorithms,
+                     block_size=2**20,
+                     rate_limiter=None):
+    """
+    Like digest_for_file, but computes a checksum with each of several algorithms while reading the file only once.
+
+    :param file_p: The path to the file we are getting the checksums for.
+    :param hash_algorithms: A list of HASH_ALGORITHMS.
+    :param block_size: How much to read in in a single chunk. Defaults to 1MB
+    :param rate_limiter: An optional rate limiter object (see ratelimit.py). Defaults to None.
+
+    :return: The list of checksums, in the same order as hash_algorithms.
     """
 
     assert os.path.exists(file_p)
     assert type(block_size) is int
 
-    md5 = hashlib.md5()
+    hash_objs = [new_hash(hash_algorithm) for hash_algorithm in hash_algorithms]
+    buffer, view = _get_buffer(block_size)
+
+    total_bytes = 0
     with open(file_p, "rb") as f:
         while True:
-            data = f.read(block_size)
-            if not data:
+            num_bytes = f.readinto(buffer)
+            if not num_bytes:
                 break
-            md5.update(data)
+            for hash_obj in hash_objs:
+                hash_obj.update(view[:num_bytes])
+            total_bytes += num_bytes
+            if rate_limiter is not None:
+                rate_limiter.consume(num_bytes)
+
+    runreport.count("bytes_read", total_bytes)
+    runreport.count("bytes_hashed", total_bytes * len(hash_objs))
+
+    return [hash_obj.digest() for hash_obj in hash_objs]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def partial_digest_for_file(file_p,
+                            hash_algorithm=DEFAULT_HASH_ALGORITHM,
+                            block_size=2**16):
+    """
+    Create a checksum of the first and last blocks of a file. This is cheap to compute no matter how large the file is,
+    and is good enough to tell most files of the same size apart. Small files are hashed in full instead (so the result
+    is the same as digest_for_file for those).
+
+    :param file_p: The path to the file we are getting a checksum for.
+    :param hash_algorithm: One of HASH_ALGORITHMS. Defaults to md5.
+    :param block_size: The size of the blocks at the start and end of the file. Defaults to 64KB.
+
+    :return: The partial checksum.
+    """
 
-    return md5.digest()
+    size = os.path.getsize(file_p)
+    if size <= 2 * block_size:
+        return digest_for_file(file_p, hash_algorithm)
+
+    hash_obj = new_hash(hash_algorithm)
+    with open(file_p, "rb") as f:
+        hash_obj.update(f.read(block_size))
+        f.seek(size - block_size)
+        hash_obj.update(f.read(block_size))
+
+    runreport.count("bytes_read", 2 * block_size)
+    runreport.count("bytes_hashed", 2 * block_size)
+
+    return hash_obj.digest()
 
 
 # ----------------------------------------------------------------------------------------------------------------------
 def files_are_identical(file_a_p,
                         file_b_p,
-                        block_size=2**20):
+                        block_size=2**20,
+                        checksum_index=None,
+                        hash_algorithm=DEFAULT_HASH_ALGORITHM):
     """
-    Compares two files to see if they are identical. First compares sizes. If the sizes match, then it does an md5
-    checksum on the files to see if they match. Ignores all metadata when comparing (name, creation or modification
-    dates, etc.) Returns True if they match, False otherwise.
+    Compares two files to see if they are identical. First compares sizes. If the sizes match, then it does a checksum
+    on the files to see if they match. Ignores all metadata when comparing (name, creation or modification dates, etc.)
+    Returns True if they match, False otherwise.
 
     :param file_a_p: The path to the first file we are comparing.
     :param file_b_p: The path to the second file we are comparing
-    :param block_size: How much to read in in a single chunk when doing the md5 checksum. Defaults to 1MB
+    :param block_size: How much to read in in a single chunk when doing the checksum. Defaults to 1MB
+    :param checksum_index: An optional checksum index object. If given, the checksums of any files that live in the
+           catalog are taken from (and added to) the index instead of being re-read from disk. In that case the index's
+           hash algorithm is used. Defaults to None.
+    :param hash_algorithm: The hash algorithm to use if there is no checksum index. Defaults to md5.
 
     :return: True if the files match, False otherwise.
     """
@@ -51,26 +218,255 @@ def files_are_identical(file_a_p,
     assert os.path.isfile(file_b_p)
 
     if os.path.getsize(file_a_p) == os.path.getsize(file_b_p):
-        md5_a = md5_for_file(file_a_p, block_size)
-        md5_b = md5_for_file(file_b_p, block_size)
-        return md5_a == md5_b
+        if checksum_index is None:
+            digest_a = digest_for_file(file_a_p, hash_algorithm, block_size)
+            digest_b = digest_for_file(file_b_p, hash_algorithm, block_size)
+        else:
+            digest_a = checksum_index.digest_for_file(file_a_p, block_size)
+            digest_b = checksum_index.digest_for_file(file_b_p, block_size)
+        return digest_a == digest_b
 
     return False
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+def copy_and_hash(src,
+                  dst,
+                  block_size=2**20,
+                  hash_algorithm=DEFAULT_HASH_ALGORITHM):
+    """
+    Copies the source file to the destination while computing the checksum of the bytes as they are read, so that the
+    source only has to be read once. A single buffer is reused for every chunk. The permission bits of the source are
+    copied as well (like shutil.copy).
+
+    :param src: The source file to be copied.
+    :param dst: The destination file name where the file will be copied.
+    :param block_size: How much to read in in a single chunk. Defaults to 1MB
+    :param hash_algorithm: One of HASH_ALGORITHMS. Defaults to md5.
+
+    :return: The checksum of the source file.
+    """
+
+    assert type(block_size) is int
+
+    hash_obj = new_hash(hash_algorithm)
+    buffer, view = _get_buffer(block_size)
+
+    total_bytes = 0
+    with open(src, "rb") as src_f, open(dst, "wb") as dst_f:
+        while True:
+            num_bytes = src_f.readinto(buffer)
+            if not num_bytes:
+                break
+            hash_obj.update(view[:num_bytes])
+            dst_f.write(view[:num_bytes])
+            total_bytes += num_bytes
+
+    shutil.copymode(src, dst)
+
+    runreport.count("bytes_read", total_bytes)
+    runreport.count("bytes_hashed", total_bytes)
+    runreport.count("bytes_written", total_bytes)
+
+    return hash_obj.digest()
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _reflink(src_f,
+             dst_f):
+    """
+    Clones the source file into the destination file (copy-on-write). Only works on filesystems that support reflinks
+    (btrfs, XFS, etc.) and only when both files are on the same filesystem.
+
+    :param src_f: The source file object, opened for reading.
+    :param dst_f: The destination file object, opened for writing.
+
+    :return: Nothing.
+    """
+
+    if fcntl is None:
+        raise OSError(errno.ENOSYS, "Reflinks are not supported on this platform")
+
+    fcntl.ioctl(dst_f.fileno(), FICLONE, src_f.fileno())
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _kernel_copy(src_f,
+                 dst_f,
+                 copy_func,
+                 block_size):
+    """
+    Copies the source file into the destination using a kernel copy function, without the data passing through user
+    space.
+
+    :param src_f: The source file object, opened for reading.
+    :param dst_f: The destination file object, opened for writing.
+    :param copy_func: Either os.copy_file_range or os.sendfile.
+    :param block_size: The maximum number of bytes to copy per call.
+
+    :return: Nothing.
+    """
+
+    if copy_func is None:
+        raise OSError(errno.ENOSYS, "This copy function is not supported on this platform")
+
+    size = os.fstat(src_f.fileno()).st_size
+    offset = 0
+    while offset < size:
+        if copy_func is os.sendfile:
+            num_bytes = os.sendfile(dst_f.fileno(), src_f.fileno(), offset, min(block_size, size - offset))
+        else:
+            num_bytes = os.copy_file_range(src_f.fileno(), dst_f.fileno(), min(block_size, size - offset),
+                                           offset, offset)
+        if num_bytes == 0:
+            break
+        offset += num_bytes
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def copy_file(src,
+              dst,
+              copy_mode="python",
+              block_size=2**20,
+              hash_algorithm=DEFAULT_HASH_ALGORITHM):
+    """
+    Copies the source file to the destination using the requested copy backend:
+
+    - reflink: clone the file (copy-on-write). No data is written, but only on the same btrfs/XFS filesystem.
+    - copy_file_range: let the kernel (or the network filesystem server) copy the data.
+    - sendfile: let the kernel copy the data.
+    - python: stream the data through a single reused buffer, hashing the source as it goes.
+    - auto: a reflink if possible, otherwise python (see AUTO_COPY_MODES), skipping backends that have already failed
+      for this pair of devices.
+
+    If a backend is not supported for this source/destination pair, the next one is tried. The permission bits of the
+    source are copied as well (like shutil.copy).
+
+    :param src: The source file to be copied.
+    :param dst: The destination file name where the file will be copied.
+    :param copy_mode: One of COPY_MODES. Defaults to "python".
+    :param block_size: How much to copy in a single chunk. Defaults to 1MB
+    :param hash_algorithm: The algorithm of the checksum the python backend computes. Defaults to md5.
+
+    :return: A tuple of (the name of the backend that was used, the checksum of the source file). The checksum is only
+             available for the python backend. For the others it is None.
+    """
+
+    assert copy_mode in COPY_MODES
+
+    if copy_mode == "python":
+        return "python", copy_and_hash(src, dst, block_size, hash_algorithm)
+
+    src_dev = os.stat(src).st_dev
+    dst_dev = os.stat(os.path.split(dst)[0]).st_dev
+
+    if copy_mode == "auto":
+        backends = AUTO_COPY_MODES
+        if src_dev != dst_dev:
+            backends = [backend for backend in backends if backend != "reflink"]
+        with _unsupported_backends_lock:
+            unsupported = _unsupported_backends.get((src_dev, dst_dev), set())
+            backends = [backend for backend in backends if backend not in unsupported]
+    else:
+        backends = [copy_mode, "python"]
+
+    for backend in backends:
+
+        if backend == "python":
+            return "python", copy_and_hash(src, dst, block_size, hash_algorithm)
+
+        try:
+            with open(src, "rb") as src_f, open(dst, "wb") as dst_f:
+                if backend == "reflink":
+                    _reflink(src_f, dst_f)
+                elif backend == "copy_file_range":
+                    _kernel_copy(src_f, dst_f, getattr(os, "copy_file_range", None), block_size)
+                else:
+                    _kernel_copy(src_f, dst_f, getattr(os, "sendfile", None), block_size)
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS:
+                raise
+            with _unsupported_backends_lock:
+                _unsupported_backends.setdefault((src_dev, dst_dev), set()).add(backend)
+            continue
+
+        shutil.copymode(src, dst)
+        if backend == "reflink":
+            runreport.count("bytes_reflinked", os.path.getsize(src))
+        else:
+            runreport.count("bytes_written", os.path.getsize(src))
+        return backend, None
+
+    return "python", copy_and_hash(src, dst, block_size, hash_algorithm)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def temp_path_for(dst):
+    """
+    Returns the temporary path a file is copied to before it is renamed to its destination. The temporary file is a
+    hidden file in the same directory (so the rename is atomic) and is ignored when the catalog is scanned.
+
+    :param dst: The destination path.
+
+    :return: The temporary path.
+    """
+
+    dir_name, file_name = os.path.split(dst)
+    return os.path.join(dir_name, "." + file_name + TEMP_SUFFIX)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def fsync_path(path):
+    """
+    Flushes a file or directory to disk. Flushing a directory makes the renames and new files in it durable. Some
+    platforms cannot open a directory for this, in which case the directory is left as it is.
+
+    :param path: The path to the file or directory.
+
+    :return: Nothing.
+    """
+
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except (IsADirectoryError, PermissionError):
+        return
+
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 def verified_copy_file(src,
-                       dst):
+                       dst,
+                       checksum_index=None,
+                       copy_mode="python",
+                       hash_algorithm=None):
     """
     Given a source file and a destination, copies the file, and then does a checksum of both files to ensure that the
-    copy matches the source. Raises an error if the copied file's md5 checksum does not match the source file's md5
-    checksum.
+    copy matches the source. Raises an error if the copied file's checksum does not match the source file's checksum.
+    With the python copy mode the source checksum is computed while the file is being copied, so only the destination
+    is re-read. A reflinked file shares its data with the source, so only the destination is hashed: a reflink writes
+    no data, but the file is still read once so that its checksum can be recorded. The kernel copy modes do not hash
+    the source, so it is read a second time.
+
+    The file is copied to a temporary name in the destination directory (see temp_path_for) and only renamed to the
+    destination once it has been verified, so an interrupted or failed copy never leaves a partial file at the
+    destination. The verification only reads what the OS has cached, so the temporary file is flushed to disk before
+    the rename, and the directory after it, so that a copy is never recorded as done before its data is on disk.
 
     :param src: The source file to be copied.
     :param dst: The destination file name where the file will be copied. If the destination file already exists, an
            error will be raised. You must supply the destination file name, not just the destination dir.
+    :param checksum_index: An optional checksum index object. If given, the verified checksum of the destination file
+           is stored in the index so that it never has to be re-read on later imports. Defaults to None.
+    :param copy_mode: The copy backend to use. See copy_file for the list of options. Defaults to "python".
+    :param hash_algorithm: One of HASH_ALGORITHMS. The checksum is stored in the checksum index together with the name
+           of the algorithm. Defaults to the checksum index's algorithm if there is one, otherwise md5.
 
-    :return: Nothing.
+    :return: A tuple of (the checksum of the source (and therefore also the destination) file, the name of the copy
+             backend that was used).
     """
 
     assert os.path.exists(src)
@@ -78,8 +474,35 @@ def verified_copy_file(src,
     assert os.path.exists(os.path.split(dst)[0])
     assert os.path.isdir(os.path.split(dst)[0])
 
-    shutil.copy(src, dst)
+    if hash_algorithm is None:
+        hash_algorithm = DEFAULT_HASH_ALGORITHM
+        if checksum_index is not None:
+            hash_algorithm = checksum_index.hash_algorithm
+
+    temp_dst = temp_path_for(dst)
+    try:
+        backend, src_digest = copy_file(src, temp_dst, copy_mode, hash_algorithm=hash_algorithm)
+        runreport.count("copy_backend_" + backend)
+
+        dst_digest = digest_for_file(temp_dst, hash_algorithm)
+        if backend == "reflink":
+            src_digest = dst_digest
+        elif src_digest is None:
+            src_digest = digest_for_file(src, hash_algorithm)
+
+        if src_digest != dst_digest:
+            msg = "Verification of copy failed (" + hash_algorithm + " checksums do not match): "
+            raise IOError(msg + src + " --> " + dst)
+
+        fsync_path(temp_dst)
+        os.replace(temp_dst, dst)
+        fsync_path(os.path.dirname(os.path.abspath(dst)))
+    except BaseException:
+        if os.path.exists(temp_dst):
+            os.remove(temp_dst)
+        raise
+
+    if checksum_index is not None:
+        checksum_index.store(dst, src_digest, hash_algorithm=hash_algorithm)
 
-    if not files_are_identical(src, dst):
-        msg = "Verification of copy failed (md5 checksums to not match): "
-        raise IOError(msg + src + " --> " + dst)
+    return src_digest, backend
@@ -0,0 +1,5 @@
+import os
+import sys
+
+REPO_DIR = os.path.split(os.path.split(os.path.abspath(__file__))[0])[0]
+sys.path.insert(0, REPO_DIR)
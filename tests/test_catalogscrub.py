@@ -0,0 +1,37 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip("bvzcomparedirs")
+
+from src.catalogscrub import CatalogScrub  # noqa: E402
+from src.checksumindex import ChecksumIndex  # noqa: E402
+from src.notify import Notify  # noqa: E402
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_limited_scrub_checks_old_entries_as_well_as_new_files(tmp_path):
+
+    catalog_d = str(tmp_path)
+    checksum_index = ChecksumIndex(catalog_d)
+
+    old_p = os.path.join(catalog_d, "old.jpg")
+    with open(old_p, "wb") as f:
+        f.write(b"old")
+    checksum_index.digest_for_file(old_p)
+    checksum_index.mark_verified("old.jpg", 0)
+
+    new_paths = list()
+    for i in range(10):
+        new_p = os.path.join(catalog_d, "new_" + str(i) + ".jpg")
+        with open(new_p, "wb") as f:
+            f.write(b"new")
+        new_paths.append(new_p)
+
+    scrub_obj = CatalogScrub(catalog_d, checksum_index, Notify("stdout", False))
+    work = list(scrub_obj._iter_work(new_paths, time.time(), 2, None, None))
+    checksum_index.close()
+
+    assert [file_p for function, argument, file_p in work] == [new_paths[0], old_p]
+    assert scrub_obj.budget_exhausted
@@ -0,0 +1,32 @@
+import os
+
+from src.checksumindex import ChecksumIndex
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_read_only_index_creates_and_writes_nothing(tmp_path):
+
+    catalog_d = str(tmp_path / "catalog")
+    read_only_index = ChecksumIndex(catalog_d, read_only=True)
+    assert not os.path.exists(catalog_d)
+
+    os.makedirs(catalog_d)
+    file_p = os.path.join(catalog_d, "IMG_0001.jpg")
+    with open(file_p, "wb") as f:
+        f.write(b"image data")
+    digest = read_only_index.digest_for_file(file_p)
+    read_only_index.close()
+    assert os.listdir(catalog_d) == ["IMG_0001.jpg"]
+
+    checksum_index = ChecksumIndex(catalog_d)
+    checksum_index.digest_for_file(file_p)
+    checksum_index.close()
+
+    read_only_index = ChecksumIndex(catalog_d, read_only=True)
+    assert read_only_index.lookup(file_p) == digest
+    assert read_only_index.prune([]) == []
+    read_only_index.close()
+
+    checksum_index = ChecksumIndex(catalog_d)
+    assert checksum_index.lookup(file_p) == digest
+    checksum_index.close()
@@ -0,0 +1,63 @@
+import builtins
+import os
+
+import pytest
+
+from src import verifiedcopy
+from src.checksumindex import ChecksumIndex
+from src.digestcache import DigestCache
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+@pytest.fixture
+def indexed_catalog(tmp_path, monkeypatch):
+    """
+    Creates a catalog holding a single indexed file, and an identical file (plus one that differs only in the middle)
+    outside of it. Any attempt to open the catalog file through verifiedcopy fails the test.
+    """
+
+    data = os.urandom(2**18)
+    catalog_d = tmp_path / "catalog"
+    catalog_d.mkdir()
+    catalog_p = str(catalog_d / "IMG_0001.CR2")
+    with open(catalog_p, "wb") as f:
+        f.write(data)
+
+    source_p = str(tmp_path / "IMG_0001.CR2")
+    with open(source_p, "wb") as f:
+        f.write(data)
+
+    different_p = str(tmp_path / "IMG_0002.CR2")
+    with open(different_p, "wb") as f:
+        f.write(data[:2**17] + bytes([data[2**17] ^ 0xff]) + data[2**17 + 1:])
+
+    checksum_index = ChecksumIndex(str(catalog_d))
+    checksum_index.digest_for_file(catalog_p)
+
+    def guarded_open(path, *args, **kwargs):
+        assert os.path.abspath(path) != catalog_p, "the indexed catalog file was opened"
+        return builtins.open(path, *args, **kwargs)
+
+    monkeypatch.setattr(verifiedcopy, "open", guarded_open, raising=False)
+    yield checksum_index, catalog_p, source_p, different_p
+    checksum_index.close()
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_indexed_catalog_file_is_not_read_when_comparing(indexed_catalog):
+
+    checksum_index, catalog_p, source_p, different_p = indexed_catalog
+
+    digest_cache = DigestCache(checksum_index)
+    assert digest_cache.files_are_identical(source_p, catalog_p)
+    assert not digest_cache.files_are_identical(different_p, catalog_p)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_indexed_catalog_file_is_not_read_when_searching(indexed_catalog):
+
+    checksum_index, catalog_p, source_p, different_p = indexed_catalog
+
+    digest_cache = DigestCache(checksum_index)
+    assert digest_cache.find_identical(source_p, [catalog_p]) == catalog_p
+    assert digest_cache.find_identical(different_p, [catalog_p]) is None
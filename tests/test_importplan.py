@@ -0,0 +1,82 @@
+import importlib.util
+import os
+import subprocess
+import sys
+
+import pytest
+
+from src.collisions import Collisions
+from src.image import Image
+from src.image import ImageConfig
+from src.importplan import PlanWriter, entry_is_current, read_plan
+from src.notify import Notify
+
+REPO_DIR = os.path.split(os.path.split(os.path.abspath(__file__))[0])[0]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def make_tree(root):
+    """
+    Creates an import directory holding one image (with no exif data) and a sidecar, and an empty catalog.
+
+    :param root: The directory to create the tree in.
+
+    :return: Nothing.
+    """
+
+    os.makedirs(os.path.join(root, "import"))
+    os.makedirs(os.path.join(root, "catalog"))
+    with open(os.path.join(root, "import", "IMG_0001.jpg"), "wb") as f:
+        f.write(b"image data")
+    with open(os.path.join(root, "import", "IMG_0001.xmp"), "wb") as f:
+        f.write(b"sidecar data")
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_plan_written_with_relative_paths_executes_from_another_directory(tmp_path, monkeypatch):
+
+    make_tree(str(tmp_path))
+    plan_path = str(tmp_path / "plan.jsonl")
+
+    monkeypatch.chdir(tmp_path)
+    config = ImageConfig("catalog", True, Notify("stdout", False))
+    image_obj = Image(os.path.join("import", "IMG_0001.jpg"), config)
+    collisions_obj = Collisions()
+    collisions_obj.destination_image_exists_identical.append(os.path.join("import", "IMG_0002.jpg"))
+    plan_writer = PlanWriter(plan_path, "catalog", True, "md5")
+    plan_writer.add(image_obj)
+    plan_writer.close(collisions_obj)
+
+    monkeypatch.chdir("/")
+    header, entries, collisions_obj = read_plan(plan_path)
+    assert header["catalog"] == str(tmp_path / "catalog")
+    for key in ("source", "dest", "sidecar", "sidecar_dest"):
+        assert os.path.isabs(entries[0][key])
+    assert collisions_obj.destination_image_exists_identical == [str(tmp_path / "import" / "IMG_0002.jpg")]
+
+    assert entry_is_current(entries[0])
+    config = ImageConfig(header["catalog"], header["rename"], Notify("stdout", False))
+    image_obj = Image.from_plan(entries[0], config)
+    assert image_obj.source_path == str(tmp_path / "import" / "IMG_0001.jpg")
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+@pytest.mark.skipif(importlib.util.find_spec("bvzdisplaylib") is None or
+                    importlib.util.find_spec("bvzcomparedirs") is None,
+                    reason="importPhotos needs bvzdisplaylib and bvzcomparedirs")
+def test_execute_plan_from_another_directory(tmp_path):
+
+    make_tree(str(tmp_path))
+    plan_path = str(tmp_path / "plan.jsonl")
+    import_photos = os.path.join(REPO_DIR, "importPhotos")
+
+    subprocess.run([sys.executable, import_photos, "-S", "import", "catalog", "--write-plan", plan_path],
+                   cwd=str(tmp_path), check=True)
+    subprocess.run([sys.executable, import_photos, "-S", str(tmp_path / "catalog"), "--execute-plan", plan_path],
+                   cwd="/", check=True)
+
+    copied = list()
+    for dir_path, dir_names, file_names in os.walk(str(tmp_path / "catalog")):
+        dir_names[:] = [dir_name for dir_name in dir_names if not dir_name.startswith(".")]
+        copied.extend(file_names)
+    assert len(copied) == 2